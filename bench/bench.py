@@ -0,0 +1,199 @@
+from execution.exec import Engine, ContradictionException
+from parsing.file_utils import parse_input_file
+import json
+import os
+import random
+import re
+import tempfile
+from time import perf_counter
+
+DEFAULT_SIZES = [100, 1000, 10000]
+
+
+# --------------------------------------------------
+# Rule base generators
+# --------------------------------------------------
+# Each generator returns the text of a rule file for a given size,
+# symbols being named with letters only: S, A, B, ..., Z, BA, BB, ...
+
+def symbol(prefix, i):
+    letters = ""
+    while True:
+        letters = chr(ord("A") + i % 26) + letters
+        i //= 26
+        if i == 0:
+            return prefix + letters
+
+
+def gen_chain(n, rng):
+    # S0 => S1 => ... => Sn, proven from the far end
+    rules = [f"{symbol('S', i)} => {symbol('S', i + 1)}" for i in range(n)]
+    return rules, [symbol("S", 0)], [symbol("S", n)]
+
+
+def gen_fan_in(n, rng, width=16):
+    # Wide Or premises over the inputs, all joined by one wide Xor
+    inputs = [symbol("I", i) for i in range(n)]
+    mids = []
+    rules = []
+    for j in range(0, n, width):
+        mid = symbol("M", j // width)
+        rules.append(" | ".join(inputs[j:j + width]) + f" => {mid}")
+        mids.append(mid)
+    rules.append(" ^ ".join(mids) + " => OUT")
+    facts = [inputs[i] for i in range(0, n, 3)]
+    return rules, facts, ["OUT"] + mids[:10]
+
+
+def gen_deep_parens(n, rng, depth=50):
+    # Rules nesting parentheses depth levels deep, alternating operators
+    rules = []
+    ops = [" + ", " | ", " ^ "]
+    for r in range(max(1, n // depth)):
+        expr = symbol("P", r * depth)
+        for d in range(1, depth):
+            expr = f"({expr}{ops[d % 3]}{symbol('P', r * depth + d)})"
+        rules.append(f"{expr} => {symbol('Q', r)}")
+    facts = [symbol("P", i) for i in range(0, n, 2)]
+    queries = [symbol("Q", r) for r in range(min(10, len(rules)))]
+    return rules, facts, queries
+
+
+def gen_equiv_cycles(n, rng, ring=8):
+    # Rings of equivalences with random chords, one fact per ring
+    rules = []
+    facts = []
+    for start in range(0, n, ring):
+        members = [symbol("E", i) for i in range(start, min(start + ring, n))]
+        if len(members) < 2:
+            continue
+        pairs = {(i, (i + 1) % len(members)) for i in range(len(members))}
+        for _ in range(len(members) // 2):
+            a, b = rng.sample(range(len(members)), 2)
+            pairs.add((a, b))
+        for a, b in sorted(pairs):
+            if (b, a) in pairs and b < a:
+                continue
+            rules.append(f"{members[a]} <=> {members[b]}")
+        facts.append(members[0])
+    queries = [symbol("E", i) for i in range(0, n, max(1, n // 10))]
+    return rules, facts, queries
+
+
+def gen_many_queries(n, rng):
+    # Random acyclic rules over earlier symbols, every symbol queried
+    seeds = max(2, n // 10)
+    rules = []
+    for i in range(seeds, n):
+        terms = [symbol("V", rng.randrange(i)) for _ in range(rng.randint(1, 3))]
+        op = rng.choice([" + ", " | "])
+        rules.append(op.join(dict.fromkeys(terms)) + f" => {symbol('V', i)}")
+    facts = [symbol("V", i) for i in range(0, seeds, 2)]
+    return rules, facts, [symbol("V", i) for i in range(n)]
+
+
+FAMILIES = {
+    "chain": gen_chain,
+    "fan_in": gen_fan_in,
+    "deep_parens": gen_deep_parens,
+    "equiv_cycles": gen_equiv_cycles,
+    "many_queries": gen_many_queries,
+}
+
+
+def write_rule_file(path, rules, facts, queries):
+    # Symbols have several letters, so fact and query words are whole names
+    # and must be used by a rule
+    used = set(re.findall(r"[A-Z]+", "\n".join(rules)))
+    facts = [name for name in facts if name in used]
+    queries = [name for name in queries if name in used]
+
+    with open(path, "w") as f:
+        f.write("\n".join(rules))
+        f.write("\n\n=" + " ".join(facts) + "\n")
+        f.write("?" + " ".join(queries) + "\n")
+
+
+# --------------------------------------------------
+# Benchmark runs
+# --------------------------------------------------
+
+def run_case(family, size, path, strategy="backward"):
+    result = {"family": family, "size": size, "status": "ok"}
+
+    try:
+        start = perf_counter()
+        pr = parse_input_file(path)
+        parsed = perf_counter()
+        engine = Engine(pr)
+        built = perf_counter()
+        result["rules"] = len(pr.rules)
+        result["symbols"] = len(pr.symtab)
+        result["nodes_before"] = pr.normalization.nodes_before
+        result["nodes_after"] = pr.normalization.nodes_after
+        result["parse"] = parsed - start
+        result["build"] = built - parsed
+
+        try:
+            engine.run(strategy)
+        except ContradictionException:
+            result["status"] = "contradiction"
+        result["infer"] = perf_counter() - built
+    except RecursionError:
+        result["status"] = "recursion limit"
+    except ValueError as e:
+        result["status"] = f"error: {e}"
+
+    return result
+
+
+def run_bench(sizes=None, strategy="backward", seed=0, families=None,
+              output="bench_output.txt", json_output="bench_output.json"):
+    sizes = sizes or DEFAULT_SIZES
+    families = families or list(FAMILIES)
+    results = []
+
+    print(format_report([], strategy))
+    with tempfile.TemporaryDirectory() as workdir:
+        for family in families:
+            for size in sizes:
+                rng = random.Random(seed)
+                rules, facts, queries = FAMILIES[family](size, rng)
+                path = os.path.join(workdir, f"{family}_{size}.txt")
+                write_rule_file(path, rules, facts, queries)
+
+                result = run_case(family, size, path, strategy)
+                results.append(result)
+                print(format_row(result), flush=True)
+
+    report = format_report(results, strategy)
+    with open(output, "w") as f:
+        f.write(report + "\n")
+    with open(json_output, "w") as f:
+        json.dump({"strategy": strategy, "seed": seed, "results": results}, f, indent=2)
+
+    print(f"\nResults written to {output} and {json_output}")
+    return results
+
+
+def format_row(r):
+    def ms(key):
+        return f"{r[key] * 1000:10.1f}" if key in r else f"{'-':>10}"
+
+    rate = ""
+    if "infer" in r and r["infer"] > 0:
+        rate = f"{r['rules'] / (r['parse'] + r['build'] + r['infer']):12.0f}"
+    return (
+        f"{r['family']:<14}{r['size']:>8}{r.get('rules', 0):>8}"
+        f"{ms('parse')}{ms('build')}{ms('infer')}{rate:>12}  {r['status']}"
+    )
+
+
+def format_report(results, strategy):
+    header = (
+        f"{'family':<14}{'size':>8}{'rules':>8}"
+        f"{'parse ms':>10}{'build ms':>10}{'infer ms':>10}{'rules/s':>12}  status"
+    )
+    lines = [f"Benchmark ({strategy} chaining)", header, "-" * len(header)]
+    lines += [format_row(r) for r in results]
+    return "\n".join(lines)
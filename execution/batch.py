@@ -0,0 +1,322 @@
+from parsing.data import *
+from execution.exec import Engine
+
+try:
+    import numpy as np
+except ImportError:  # numpy is only needed for batch evaluation
+    np = None
+
+# Three-valued codes used in scenario and result matrices
+TRUE = 1
+FALSE = 0
+UNKNOWN = -1
+
+
+class BatchResult:
+    def __init__(self, queries, values, contradictions):
+        self.queries = queries                  # column names of values
+        self.values = values                    # N x queries, TRUE/FALSE/UNKNOWN
+        self.contradictions = contradictions    # N, True where the row contradicts
+
+
+# --------------------------------------------------
+# Vectorized expressions
+# --------------------------------------------------
+# A value is a pair of boolean arrays (known, value) over the scenarios,
+# value only being meaningful where known is set.
+
+def vector_expr(expr, index, lenient):
+    """Closure f(known, value) -> (known, value) evaluating expr on every row"""
+    if isinstance(expr, Ident):
+        i = index[expr.name]
+        return lambda k, v: (k[i], v[i])
+
+    # Postfix program, children first, run on a stack of values so that
+    # nesting depth is not limited by recursion
+    program = []
+    todo = [(expr, False)]
+    while todo:
+        e, done = todo.pop()
+        if isinstance(e, Ident):
+            program.append((Ident, index[e.name]))
+        elif done:
+            program.append((type(e), 1 if isinstance(e, Not) else len(e.terms)))
+        else:
+            todo.append((e, True))
+            children = (e.child,) if isinstance(e, Not) else e.terms
+            todo.extend((t, False) for t in reversed(children))
+
+    def evaluate(k, v):
+        stack = []
+        for op, arg in program:
+            if op is Ident:
+                stack.append((k[arg], v[arg]))
+            elif op is Not:
+                ck, cv = stack[-1]
+                stack[-1] = (ck, ck & ~cv)
+            else:
+                vals = stack[-arg:]
+                del stack[-arg:]
+                stack.append(combine(op, vals, lenient))
+        return stack[0]
+    return evaluate
+
+
+def combine(op, vals, lenient):
+    if op is And:
+        any_false = np.logical_or.reduce([tk & ~tv for tk, tv in vals])
+        all_true = np.logical_and.reduce([tk & tv for tk, tv in vals])
+        return any_false | all_true, all_true
+
+    if op is Or:
+        any_true = np.logical_or.reduce([tk & tv for tk, tv in vals])
+        all_false = np.logical_and.reduce([tk & ~tv for tk, tv in vals])
+        return any_true | all_false, any_true
+
+    parity = np.logical_xor.reduce([tk & tv for tk, tv in vals])
+    if lenient:
+        # Proven premises ignore undetermined terms, like Engine.prove
+        return np.ones_like(parity), parity
+    known = np.logical_and.reduce([tk for tk, _ in vals])
+    return known, parity & known
+
+
+class VectorRule:
+    def __init__(self, rule, goal, index):
+        # Same side selection as Engine.prove
+        if isinstance(rule, Implies):
+            premise, conclusion = rule.premise, rule.conclusion
+        elif goal in {i.name for i in idents_of(rule.left)}:
+            premise, conclusion = rule.right, rule.left
+        else:
+            premise, conclusion = rule.left, rule.right
+
+        # An equivalence between two literals makes its symbols aliases
+        self.equivalence = isinstance(rule, Equiv)
+        self.alias = self.equivalence and all(
+            isinstance(side, Ident) or isinstance(side, Not) and isinstance(side.child, Ident)
+            for side in (rule.left, rule.right)
+        )
+        self.premise = vector_expr(premise, index, lenient=True)
+        self.op = type(conclusion)
+        terms = conclusion.terms if isinstance(conclusion, (And, Or, Xor)) else []
+        self.others = [
+            vector_expr(t, index, lenient=False)
+            for t in terms
+            if not (isinstance(t, Ident) and t.name == goal)
+        ]
+        # Symbols the premise reads, the other conclusion terms are only observed
+        self.inputs = {index[i.name] for i in idents_of(premise)}
+        self.deps = sorted(self.inputs - {index[goal]})
+
+    def conclude(self, k, v):
+        """Value given to the goal on every row, and rows that contradict"""
+        pk, pv = self.premise(k, v)
+        is_true, is_false = pk & pv, pk & ~pv
+        no_contradiction = np.zeros_like(pk)
+
+        if self.op is Ident:
+            return pk, pv, no_contradiction
+        if self.op is Not:
+            return pk, is_false, no_contradiction
+
+        others = [t(k, v) for t in self.others]
+        peek_true = [tk & tv for tk, tv in others]
+        peek_false = [tk & ~tv for tk, tv in others]
+        ones = np.ones_like(pk)
+
+        if self.op is And:
+            all_true = np.logical_and.reduce(peek_true, initial=True) & ones
+            contradiction = is_true & np.logical_or.reduce(peek_false, initial=False)
+            return is_true | (is_false & all_true), is_true, contradiction
+
+        if self.op is Or:
+            all_false = np.logical_and.reduce(peek_false, initial=True) & ones
+            return is_false | (is_true & all_false), is_true & all_false, no_contradiction
+
+        # Xor
+        true_count = np.sum(peek_true, axis=0) if peek_true else np.zeros(pk.shape, int)
+        unknown = np.logical_or.reduce([~tk for tk, _ in others], initial=False) & ones
+        none_true = (true_count == 0) & ~unknown
+        known = (is_true & (none_true | (true_count >= 1))) \
+            | (is_false & ((true_count == 1) | none_true))
+        value = (is_true & none_true) | (is_false & (true_count == 1))
+        return known, value, no_contradiction
+
+
+# --------------------------------------------------
+# Batch evaluation
+# --------------------------------------------------
+# Every row is settled in dependency order, which only gives the same
+# values as Engine when no symbol depends on itself through premises.
+# Symbols joined by equivalences are settled together, giving each other
+# values until none changes. Their other rules may read the group only
+# when every equivalence in it is between literals; any other cycle
+# rejects the rule base.
+
+class BatchEvaluator:
+    def __init__(self, pr: ParseResult):
+        if np is None:
+            raise ValueError("Batch evaluation requires numpy")
+
+        engine = Engine(pr)
+        self.names = sorted(engine.symbols)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self.queries = [q.name for q in pr.queries]
+        self.query_rows = [self.index[q] for q in self.queries]
+
+        self.rules = [
+            [
+                VectorRule(rn.rule, name, self.index)
+                for rn in dict.fromkeys(engine.symbol_nodes[engine.symtab.ids[name]].produced_by_rules)
+            ]
+            for name in self.names
+        ]
+        self.order = self.check_acyclic()
+
+    def equivalence_groups(self):
+        # Symbols joined through equivalences share one representative
+        parent = list(range(len(self.names)))
+
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        for i, rules in enumerate(self.rules):
+            for r in rules:
+                if r.equivalence:
+                    for d in r.inputs:
+                        parent[find(d)] = find(i)
+        return [find(i) for i in range(len(self.names))]
+
+    def check_acyclic(self):
+        """Groups of symbol rows, in an order that settles premise inputs first"""
+        group = self.equivalence_groups()
+        members = {}
+        for i, g in enumerate(group):
+            members.setdefault(g, []).append(i)
+
+        # Groups are removed once every premise input they read is removed,
+        # whatever is left is on a cycle or reads one
+        readers = {g: [] for g in members}
+        waiting = dict.fromkeys(members, 0)
+        cycle = set()
+        for g, symbols in members.items():
+            inputs = set()
+            rules = [r for i in symbols for r in self.rules[i]]
+            aliases = len(symbols) > 1 and all(r.alias for r in rules if r.equivalence)
+            for r in rules:
+                reads = {group[d] for d in r.inputs}
+                if g in reads and not r.equivalence and not aliases:
+                    cycle.add(g)
+                inputs |= reads - {g}
+            waiting[g] = len(inputs)
+            for d in inputs:
+                readers[d].append(g)
+
+        order = []
+        ready = [g for g, n in waiting.items() if n == 0 and g not in cycle]
+        while ready:
+            g = ready.pop()
+            order.append(members[g])
+            for reader in readers[g]:
+                waiting[reader] -= 1
+                if waiting[reader] == 0 and reader not in cycle:
+                    ready.append(reader)
+
+        done = {i for symbols in order for i in symbols}
+        left = [name for i, name in enumerate(self.names) if i not in done]
+        if left:
+            raise ValueError(
+                "Batch evaluation needs an acyclic rule base, no evaluation order for: " + ", ".join(left)
+            )
+        return order
+
+    def facts_matrix(self, scenarios, columns=None):
+        # Scenario columns in the given order, missing symbols are unknown
+        scenarios = np.asarray(scenarios)
+        if scenarios.dtype == object:
+            scenarios = np.vectorize(
+                lambda x: UNKNOWN if x is None else int(bool(x)), otypes=[np.int8]
+            )(scenarios)
+        columns = columns or self.names
+        if scenarios.ndim != 2 or scenarios.shape[1] != len(columns):
+            raise ValueError(f"Expected an N x {len(columns)} scenario matrix")
+
+        codes = np.full((len(self.names), scenarios.shape[0]), UNKNOWN, dtype=np.int8)
+        for col, name in enumerate(columns):
+            if name not in self.index:
+                raise ValueError(f"Unknown symbol {name!r} in scenario columns")
+            codes[self.index[name]] = scenarios[:, col]
+        return codes
+
+    def settle(self, k, v, settled, contradictions):
+        """Decide unsettled symbols, each group once its inputs are settled"""
+        for group in self.order:
+            # Equivalent symbols are decided again while one of them changes
+            while self.sweep(group, k, v, settled, contradictions) and len(group) > 1:
+                pass
+            settled[group] = True
+
+    def sweep(self, group, k, v, settled, contradictions):
+        progress = False
+        for i in group:
+            rules = self.rules[i]
+            rows = ~settled[i] & ~contradictions
+            if not rules or not rows.any():
+                continue
+
+            any_true = np.zeros_like(rows)
+            any_false = np.zeros_like(rows)
+            for r in rules:
+                rk, rv, contradiction = r.conclude(k, v)
+                contradictions |= rows & contradiction
+                any_true |= rk & rv
+                any_false |= rk & ~rv
+            contradictions |= rows & any_true & any_false
+
+            determined = rows & (any_true | any_false) & ~contradictions
+            if not determined.any():
+                continue
+
+            k[i] |= determined
+            v[i] |= determined & any_true
+            settled[i] |= determined
+            progress = True
+        return progress
+
+    def evaluate(self, scenarios, columns=None) -> BatchResult:
+        codes = self.facts_matrix(scenarios, columns)
+        k = codes != UNKNOWN
+        v = codes == TRUE
+        n = codes.shape[1]
+        contradictions = np.zeros(n, dtype=bool)
+
+        is_query = np.zeros(len(self.names), dtype=bool)
+        is_query[self.query_rows] = True
+        no_rules = np.array([not rules for rules in self.rules])
+
+        # Queries that no rule produces are False
+        default = (is_query & no_rules)[:, None] & ~k
+        k |= default
+
+        # Step 1: decide everything the facts and rules allow
+        settled = k | no_rules[:, None]
+        self.settle(k, v, settled, contradictions)
+
+        # Step 2: undetermined non-query symbols default to False
+        k |= ~is_query[:, None]
+
+        # Step 3: re-evaluate undetermined queries with those defaults
+        settled = k.copy()
+        self.settle(k, v, settled, contradictions)
+
+        values = np.where(k, v.astype(np.int8), np.int8(UNKNOWN))[self.query_rows].T
+        values[contradictions] = UNKNOWN
+        return BatchResult(self.queries, values, contradictions)
+
+
+def evaluate_batch(pr: ParseResult, scenarios, columns=None) -> BatchResult:
+    return BatchEvaluator(pr).evaluate(scenarios, columns)
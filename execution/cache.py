@@ -0,0 +1,92 @@
+import hashlib
+import os
+import pickle
+import sys
+import tempfile
+from pathlib import Path
+
+from parsing.file_utils import parser
+from execution.exec import Engine
+
+# Bump whenever parsed rules or the built graph change shape,
+# so engines cached by an older version are rebuilt
+ENGINE_VERSION = "8"
+
+# Set once a failed write has been reported
+warned = False
+
+
+# --------------------------------------------------
+# On-disk engine cache
+# --------------------------------------------------
+# Engines are stored right after build_graph, before any inference,
+# under a key derived from the rule file contents and ENGINE_VERSION.
+
+def cache_key(content: bytes, variant: str = "") -> str:
+    h = hashlib.sha256()
+    h.update(ENGINE_VERSION.encode())
+    h.update(b"\0")
+    h.update(variant.encode())
+    h.update(b"\0")
+    h.update(content)
+    return h.hexdigest()
+
+
+def load_cached_engine(path: str, cache_dir: str, tracer=None, prune=False, flat=False) -> Engine:
+    try:
+        content = Path(path).read_bytes()
+    except OSError:
+        # Let the regular loader report the error
+        return Engine(parser(path), tracer, prune, flat)
+
+    variant = ",".join(name for name, on in (("prune", prune), ("flat", flat)) if on)
+    entry = Path(cache_dir) / f"{cache_key(content, variant)}.pickle"
+
+    engine = None
+    if entry.exists():
+        try:
+            with open(entry, "rb") as f:
+                engine = pickle.load(f)
+        except Exception:
+            # Unreadable or outdated entry: rebuild it
+            engine = None
+
+    if engine is None:
+        engine = Engine(parser(path), prune=prune, flat=flat)
+        store(entry, engine)
+
+    engine.set_tracer(tracer)
+    return engine
+
+
+def store(entry: Path, engine: Engine) -> None:
+    # An entry that cannot be written leaves the engine uncached, the run
+    # goes on with the engine just built
+    try:
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file first so concurrent runs never read a partial entry
+        fd, tmp = tempfile.mkstemp(dir=entry.parent, suffix=".tmp")
+    except OSError as e:
+        warn(e)
+        return
+
+    try:
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(engine, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, entry)
+    except RecursionError:
+        # Rules nested deeper than pickle can follow are left uncached
+        os.unlink(tmp)
+    except OSError as e:
+        os.unlink(tmp)
+        warn(e)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def warn(error: OSError) -> None:
+    global warned
+    if not warned:
+        warned = True
+        print(f"Engine cache not written: {error}", file=sys.stderr)
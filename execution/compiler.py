@@ -0,0 +1,356 @@
+from parsing.data import *
+
+# --------------------------------------------------
+# Rule compilation
+# --------------------------------------------------
+# Each rule AST is turned once into a tree of closures, so the engine
+# evaluates premises without re-dispatching on node types at every visit.
+# Premises are generators: an identifier whose value lookup() cannot give
+# is yielded to the engine, which proves it on its own goal stack and
+# sends the value back.
+
+
+# Lookup answer for a goal the engine has to prove
+UNPROVEN = object()
+
+
+def observing(lookup):
+    """lookup, marked as traced or profiled
+
+    Known identifiers are read from facts without a lookup; premises given
+    an observing lookup still pass them through it, so every identifier
+    read is counted and traced."""
+    def observed(goal, depth):
+        return lookup(goal, depth)
+    observed.observing = True
+    return observed
+
+
+def compile_eval(expr, facts):
+    """Generator evaluating each identifier at depth: f(lookup, depth) -> True/False/None"""
+    if isinstance(expr, Ident):
+        def ident(lookup, depth):
+            value = lookup(expr, depth)
+            if value is UNPROVEN:
+                value = yield expr, depth
+            return value
+        return ident
+
+    if isinstance(expr, Not):
+        child = compile_eval(expr.child, facts)
+
+        def negate(lookup, depth):
+            v = yield from child(lookup, depth)
+            return None if v is None else not v
+        return negate
+
+    # Identifier terms are looked up inline rather than through a generator each
+    terms = [
+        (t, None) if isinstance(t, Ident) else (t, compile_eval(t, facts))
+        for t in getattr(expr, "terms", [])
+    ]
+
+    if isinstance(expr, And):
+        def conjunction(lookup, depth):
+            vals = yield from evaluate_terms(terms, facts, lookup, depth)
+            if False in vals:
+                return False
+            if None in vals:
+                return None
+            return True
+        evaluate = conjunction
+
+    elif isinstance(expr, Or):
+        def disjunction(lookup, depth):
+            vals = yield from evaluate_terms(terms, facts, lookup, depth)
+            if True in vals:
+                return True
+            if None in vals:
+                return None
+            return False
+        evaluate = disjunction
+
+    elif isinstance(expr, Xor):
+        def exclusive(lookup, depth):
+            vals = yield from evaluate_terms(terms, facts, lookup, depth)
+            result = False
+            for v in vals:
+                if v is not None:
+                    result ^= v
+            return result
+        evaluate = exclusive
+
+    else:
+        return lambda lookup, depth: iter(())
+
+    # Flat premise: once all its facts are known it is decided by mask checks
+    if all(isinstance(t, Ident) for t in expr.terms):
+        return compile_mask(expr, facts, evaluate)
+    return evaluate
+
+
+def evaluate_terms(terms, facts, lookup, depth):
+    # Every term, left to right: proving a term can change what a later one
+    # proves to, so none is skipped or reordered. Known identifiers are read
+    # without a lookup unless it is observing.
+    vals = []
+    for t, evaluate in terms:
+        if evaluate is None:
+            v = facts.get(t.id)
+            if v is None or hasattr(lookup, "observing"):
+                v = lookup(t, depth)
+                if v is UNPROVEN:
+                    v = yield t, depth
+        else:
+            v = yield from evaluate(lookup, depth)
+        vals.append(v)
+    return vals
+
+
+def compile_mask(expr, facts, evaluate):
+    mask = facts.mask(t.id for t in expr.terms)
+
+    if isinstance(expr, And):
+        decide = lambda: facts.all_true(mask)
+    elif isinstance(expr, Or):
+        decide = lambda: facts.any_true(mask)
+    else:
+        # Repeated terms cancel out, only symbols seen an odd number of times count
+        odd = 0
+        for t in expr.terms:
+            odd ^= facts.bit(t.id)
+        decide = lambda: facts.count_true(odd) % 2 == 1
+
+    def masked(lookup, depth):
+        if facts.all_known(mask):
+            if hasattr(lookup, "observing"):
+                for t in expr.terms:
+                    lookup(t, depth)
+            return decide()
+        return (yield from evaluate(lookup, depth))
+    return masked
+
+
+def run_steps(steps, prove):
+    """Run an evaluation generator, proving each goal it yields with prove(ident, depth)"""
+    try:
+        request = next(steps)
+        while True:
+            request = steps.send(prove(*request))
+    except StopIteration as stop:
+        return stop.value
+
+
+def compile_peek(expr, facts):
+    """Closure observing values in facts without proving: f() -> True/False/None"""
+    if isinstance(expr, Ident):
+        sid = expr.id
+        return lambda: facts.get(sid)
+
+    if isinstance(expr, Not):
+        child = compile_peek(expr.child, facts)
+
+        def negate():
+            v = child()
+            return None if v is None else not v
+        return negate
+
+    terms = [compile_peek(t, facts) for t in getattr(expr, "terms", [])]
+
+    if isinstance(expr, And):
+        def conjunction():
+            vals = [t() for t in terms]
+            if False in vals:
+                return False
+            if None in vals:
+                return None
+            return True
+        return conjunction
+
+    if isinstance(expr, Or):
+        def disjunction():
+            vals = [t() for t in terms]
+            if True in vals:
+                return True
+            if None in vals:
+                return None
+            return False
+        return disjunction
+
+    if isinstance(expr, Xor):
+        def exclusive():
+            vals = [t() for t in terms]
+            if None in vals:
+                return None
+            result = False
+            for v in vals:
+                result ^= v
+            return result
+        return exclusive
+
+    return lambda: None
+
+
+# --------------------------------------------------
+# Deeply nested expressions
+# --------------------------------------------------
+# Closures nest one call per level of their expression, so expressions
+# deeper than MAX_NESTING are evaluated on an explicit stack instead, with
+# the same values, proof order and lookup depths.
+
+MAX_NESTING = 100
+
+
+def nesting(expr):
+    """Depth of the deepest node of expr, 1 for an identifier"""
+    deepest = 0
+    todo = [(expr, 1)]
+    while todo:
+        expr, level = todo.pop()
+        deepest = max(deepest, level)
+        if isinstance(expr, Not):
+            todo.append((expr.child, level + 1))
+        elif isinstance(expr, (And, Or, Xor)):
+            todo.extend((t, level + 1) for t in expr.terms)
+    return deepest
+
+
+def compile_premise(expr, facts):
+    if nesting(expr) > MAX_NESTING:
+        return compile_deep(expr, facts)
+    return compile_eval(expr, facts)
+
+
+def compile_observer(expr, facts):
+    if nesting(expr) > MAX_NESTING:
+        return compile_deep_peek(expr, facts)
+    return compile_peek(expr, facts)
+
+
+def compile_deep(expr, facts):
+    """Same generator as compile_eval, keeping one frame per open node on a list"""
+    def evaluate(lookup, depth):
+        def term(t, depth):
+            # Identifiers are read, looked up or proven, other terms pushed on the stack
+            if isinstance(t, Ident):
+                v = facts.get(t.id)
+                if v is not None and not hasattr(lookup, "observing"):
+                    return v
+                v = lookup(t, depth)
+                if v is UNPROVEN:
+                    v = yield t, depth
+                return v
+            return (yield t, depth)
+
+        def steps(e, depth):
+            if isinstance(e, Not):
+                v = yield from term(e.child, depth)
+                return None if v is None else not v
+
+            if all(isinstance(t, Ident) for t in e.terms):
+                vals = [facts.get(t.id) for t in e.terms]
+                if None not in vals:
+                    if hasattr(lookup, "observing"):
+                        for t in e.terms:
+                            lookup(t, depth)
+                    if isinstance(e, And):
+                        return False not in vals
+                    if isinstance(e, Or):
+                        return True in vals
+                    return vals.count(True) % 2 == 1
+
+            vals = []
+            for t in e.terms:
+                vals.append((yield from term(t, depth)))
+            if isinstance(e, And):
+                return False if False in vals else None if None in vals else True
+            if isinstance(e, Or):
+                return True if True in vals else None if None in vals else False
+            result = False
+            for v in vals:
+                if v is not None:
+                    result ^= v
+            return result
+
+        stack = [steps(expr, depth)]
+        value = None
+        while stack:
+            try:
+                request = stack[-1].send(value)
+            except StopIteration as stop:
+                stack.pop()
+                value = stop.value
+                continue
+            if isinstance(request[0], Ident):
+                # A goal for the engine
+                value = yield request
+            else:
+                stack.append(steps(*request))
+                value = None
+        return value
+    return evaluate
+
+
+def compile_deep_peek(expr, facts):
+    """Same closure as compile_peek, walking expr on an explicit stack"""
+    def step(e):
+        if isinstance(e, Ident):
+            return facts.get(e.id)
+        if isinstance(e, Not):
+            v = yield (e.child,)
+            return None if v is None else not v
+
+        vals = []
+        for t in e.terms:
+            vals.append((yield (t,)))
+        if isinstance(e, And):
+            return False if False in vals else None if None in vals else True
+        if isinstance(e, Or):
+            return True if True in vals else None if None in vals else False
+        if None in vals:
+            return None
+        return vals.count(True) % 2 == 1
+
+    return lambda: walk(step, expr)
+
+
+class Conclusion:
+    def __init__(self, expr, settled):
+        # Operator of the conclusion and a peek closure per term,
+        # with the term id when the term is a bare identifier
+        self.op = type(expr)
+        terms = expr.terms if isinstance(expr, (And, Or, Xor)) else [expr]
+        self.terms = [
+            (t.id if isinstance(t, Ident) else None, compile_observer(t, settled))
+            for t in terms
+        ]
+
+
+class CompiledRule:
+    def __init__(self, rule, facts, settled):
+        # Premises are proven against facts, conclusion terms are
+        # observed in settled, the values committed by the engine
+        if isinstance(rule, Implies):
+            self.premise = compile_premise(rule.premise, facts)
+            self.conclusion = Conclusion(rule.conclusion, settled)
+        else:
+            self.left = compile_premise(rule.left, facts)
+            self.right = compile_premise(rule.right, facts)
+            self.left_conclusion = Conclusion(rule.left, settled)
+            self.right_conclusion = Conclusion(rule.right, settled)
+
+
+def polarities(expr):
+    """Polarity of each identifier id in expr: True, False, or None when it occurs both ways"""
+    found = {}
+    todo = [(expr, True)]
+    while todo:
+        expr, positive = todo.pop()
+        if isinstance(expr, Ident):
+            found[expr.id] = positive if found.get(expr.id, positive) == positive else None
+        elif isinstance(expr, Not):
+            todo.append((expr.child, not positive))
+        elif isinstance(expr, (And, Or, Xor)):
+            todo.extend((t, positive) for t in reversed(expr.terms))
+    return found
+
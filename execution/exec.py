@@ -1,81 +1,313 @@
+from collections import deque
 from parsing.data import *
+from execution.compiler import CompiledRule, UNPROVEN, observing, polarities, run_steps
+from execution.facts import FactState
+from execution.flat import FlatRules
 
 class SymbolNode:
     def __init__(self, ident):
         self.ident = ident
         self.produced_by_rules = []
         self.used_in_rules = []
+        self.productions = []
 
 
 class RuleNode:
-    def __init__(self, rule, original):
+    def __init__(self, rule, original, facts, settled):
         self.rule = rule
         self.original = original
         self.premise_idents = []
         self.conclusion_idents = []
+        self.compiled = CompiledRule(rule, facts, settled)
+
+    def __getstate__(self):
+        # Closures cannot be pickled, the engine compiles the rule again on load
+        state = self.__dict__.copy()
+        del state["compiled"]
+        return state
+
+
+class Production:
+    """A rule concluding a symbol, from the side where the symbol occurs"""
+
+    def __init__(self, rule_node, side, positive, context, premise_text, conclusion_text, span=None):
+        self.rule_node = rule_node
+        self.side = side                        # "conclusion", "left" or "right"
+        self.positive = positive                # None when the symbol occurs both ways
+        self.context = context                  # operator of the concluding side
+        self.premise_text = premise_text
+        self.conclusion_text = conclusion_text
+        self.span = span                        # premise nodes in the flat storage
+        self.bind()
+
+    def bind(self):
+        compiled = self.rule_node.compiled
+        if self.side == "conclusion":
+            self.premise, self.conclusion = compiled.premise, compiled.conclusion
+        elif self.side == "left":
+            self.premise, self.conclusion = compiled.right, compiled.left_conclusion
+        else:
+            self.premise, self.conclusion = compiled.left, compiled.right_conclusion
+
+    def premise_expr(self):
+        rule = self.rule_node.rule
+        if self.side == "conclusion":
+            return rule.premise
+        return rule.right if self.side == "left" else rule.left
+
+    def __getstate__(self):
+        # Bound to the compiled rule again on load
+        state = self.__dict__.copy()
+        del state["premise"], state["conclusion"]
+        return state
 
 
 class ContradictionException(Exception):
     pass
 
 
+def strongly_connected_components(deps):
+    # Tarjan's algorithm with an explicit stack over deps[v], the nodes v
+    # depends on, so components come out dependencies first
+    n = len(deps)
+    index = [None] * n
+    low = [0] * n
+    on_stack = [False] * n
+    stack = []
+    components = []
+    counter = 0
+
+    for root in range(n):
+        if index[root] is not None:
+            continue
+        index[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack[root] = True
+        work = [(root, iter(deps[root]))]
+
+        while work:
+            v, edges = work[-1]
+            for w in edges:
+                if index[w] is None:
+                    index[w] = low[w] = counter
+                    counter += 1
+                    stack.append(w)
+                    on_stack[w] = True
+                    work.append((w, iter(deps[w])))
+                    break
+                if on_stack[w]:
+                    low[v] = min(low[v], index[w])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[v])
+                if low[v] == index[v]:
+                    component = []
+                    while True:
+                        w = stack.pop()
+                        on_stack[w] = False
+                        component.append(w)
+                        if w == v:
+                            break
+                    components.append(component)
+
+    return components
+
+
 class Engine:
-    def __init__(self, pr: ParseResult, logging=False):
+    def __init__(self, pr: ParseResult, tracer=None, prune=False, flat=False):
         self.rules = pr.rules
         self.original_rules = pr.original_rules
-        self.symbols = {ident.name: ident for ident in pr.symbols}
+        self.symtab = pr.symtab
+        self.all_symbols = {ident.name: ident for ident in pr.symbols}
         self.queries = pr.queries
-
-        self.symbol_nodes = {}
+        self.query_ids = {q.id for q in pr.queries}
+        self.normalization = pr.normalization
+
+        # Symbol values, one known bit and one value bit per symbol id.
+        # The rule AST is never written to: proofs work on facts, and
+        # settled holds the values committed by set_value, which
+        # conclusions observe.
+        self.facts = FactState(len(self.symtab))
+        for name in pr.initial_facts:
+            self.facts.set(self.symtab.ids[name], True)
+        self.initial = self.facts.copy()
+        self.settled = self.facts.copy()
+
+        # Indexed by symbol id
+        self.symbol_nodes = [None] * len(self.symtab)
         self.rule_nodes = []
-        self.logging = logging
-        self.logs = []
+        self.set_tracer(tracer)
+        self.set_profiler(None)
+
+        # Tabling: finished proofs and goals currently on the proof stack
+        self.table = {}
+        self.pending = {}
+        self.pending_stack = []
+        self.in_progress = {}
+        self.assumed = {}
+        self.cycle_low = None
+
+        # Strongly connected components and the facts they were computed for
+        self.components = None
+
+        # Symbols defaulted to False by the last runs, and the symbols whose
+        # proven value depends on when they are proven, with the number of
+        # rules built when those were found
+        self.defaulted = set()
+        self.unsteady = None
+        self.strategy = None
+
+        # Goal-directed mode: only symbols in the cone of the queries are
+        # evaluated, and only rules producing them are built
+        self.prune = prune
+        self.evaluated = set()     # cone of the last run
+        self.symbols = {}
+        self.cone = set()
+        self.built_rules = set()
+        self.producers = {}
+
+        # Rules also stored as flat postfix arrays, premises then being
+        # read from them when evaluated without proving
+        self.flat = FlatRules() if flat else None
 
         self.build_graph()
 
+    def __getstate__(self):
+        # Tracers hold open streams, a loaded engine is given its own
+        state = self.__dict__.copy()
+        state["tracer"], state["tracing"] = None, False
+        state["profiler"], state["profiling"] = None, False
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        for rn in self.rule_nodes:
+            rn.compiled = CompiledRule(rn.rule, self.facts, self.settled)
+        for symbol_node in self.symbol_nodes:
+            for production in symbol_node.productions:
+                production.bind()
+
     # --------------------------------------------------
     # Graph construction
     # --------------------------------------------------
 
     def build_graph(self):
         # Create fact nodes
-        for ident in self.symbols.values():
-            self.symbol_nodes[ident.name] = SymbolNode(ident)
+        for ident in self.all_symbols.values():
+            self.symbol_nodes[ident.id] = SymbolNode(ident)
+
+        if not self.prune:
+            self.symbols = self.all_symbols
+            self.cone = set(range(len(self.symtab)))
+            for index in range(len(self.rules)):
+                self.add_rule(index)
+            return
+
+        # Rules by the symbols they can conclude, to walk the cone backward
+        for index, rule in enumerate(self.rules):
+            conclusion = rule.conclusion if isinstance(rule, Implies) else rule
+            for i in self.idents_in_expr(conclusion):
+                self.producers.setdefault(i.id, []).append(index)
+        self.extend_cone(self.query_ids)
+
+
+    def extend_cone(self, ids):
+        # Add the symbols that can influence ids, building their rules in file order
+        todo = [sid for sid in ids if sid not in self.cone]
+        indexes = set()
+        while todo:
+            sid = todo.pop()
+            if sid in self.cone:
+                continue
+            self.cone.add(sid)
+            for index in self.producers.pop(sid, ()):
+                if index in indexes or index in self.built_rules:
+                    continue
+                indexes.add(index)
+                for i in self.idents_in_expr(self.rules[index]):
+                    if i.id not in self.cone:
+                        todo.append(i.id)
+
+        for index in sorted(indexes):
+            self.add_rule(index)
+
+        # Same iteration order as a full engine
+        self.symbols = {
+            name: ident for name, ident in self.all_symbols.items() if ident.id in self.cone
+        }
+        self.components = None
+
+
+    def add_rule(self, index):
+        rule, original = self.rules[index], self.original_rules[index]
+        self.built_rules.add(index)
 
-        # Create rule nodes and link graph
-        for rule, original in zip(self.rules, self.original_rules):
-            rn = RuleNode(rule, original)
+        # Create rule node and link graph
+        rn = RuleNode(rule, original, self.facts, self.settled)
 
-            if isinstance(rule, Implies):
-                rn.premise_idents = self.idents_in_expr(rule.premise)
-                rn.conclusion_idents = self.idents_in_expr(rule.conclusion)
+        if isinstance(rule, Implies):
+            rn.premise_idents = self.idents_in_expr(rule.premise)
+            rn.conclusion_idents = self.idents_in_expr(rule.conclusion)
 
-            elif isinstance(rule, Equiv):
-                rn.premise_idents = (
-                    self.idents_in_expr(rule.left)
-                    + self.idents_in_expr(rule.right)
-                )
-                rn.conclusion_idents = rn.premise_idents
+        elif isinstance(rule, Equiv):
+            rn.premise_idents = (
+                self.idents_in_expr(rule.left)
+                + self.idents_in_expr(rule.right)
+            )
+            rn.conclusion_idents = rn.premise_idents
 
-            self.rule_nodes.append(rn)
+        self.rule_nodes.append(rn)
 
-            for i in rn.premise_idents:
-                self.symbol_nodes[i.name].used_in_rules.append(rn)
+        for i in rn.premise_idents:
+            self.symbol_nodes[i.id].used_in_rules.append(rn)
 
-            for i in rn.conclusion_idents:
-                self.symbol_nodes[i.name].produced_by_rules.append(rn)
+        # Each rule is indexed once per symbol it concludes, with the side
+        # to prove for it and the text of both sides for traces
+        first = second = None
+        if self.flat is not None:
+            first, second = self.flat.sides(self.flat.append(rule))
+
+        if isinstance(rule, Implies):
+            premise_text, conclusion_text = self.split_expression(original)
+            sides = [("conclusion", rule.conclusion, premise_text, conclusion_text, first)]
+        else:
+            left_text, right_text = self.split_expression(original)
+            sides = [
+                ("left", rule.left, right_text, left_text, second),
+                ("right", rule.right, left_text, right_text, first),
+            ]
+
+        for side, conclusion, premise_text, conclusion_text, span in sides:
+            for sid, positive in polarities(conclusion).items():
+                symbol_node = self.symbol_nodes[sid]
+                # A symbol on both sides of an equivalence is concluded by the left one
+                if symbol_node.produced_by_rules and symbol_node.produced_by_rules[-1] is rn:
+                    continue
+                symbol_node.produced_by_rules.append(rn)
+                symbol_node.productions.append(Production(
+                    rn, side, positive, type(conclusion), premise_text, conclusion_text, span
+                ))
 
     # --------------------------------------------------
     # Utils
     # --------------------------------------------------
 
-    def log(self, message):
-        self.logs.append(message)
+    def set_tracer(self, tracer):
+        # Call sites test self.tracing first, so a disabled trace costs one attribute check
+        self.tracer = tracer
+        self.tracing = tracer is not None
 
-    
-    def save_logs(self, filename="reasoning.log"):
-        with open(filename, "w") as f:
-            f.write("\n".join(self.logs))
+
+    def set_profiler(self, profiler):
+        self.profiler = profiler
+        self.profiling = profiler is not None
+
+
+    def trace(self, event, depth=0, **fields):
+        self.tracer.emit(event, depth, **fields)
 
 
     def split_expression(self, expr):
@@ -90,166 +322,67 @@ class Engine:
             return expr, None
 
     
-    def is_not_query(self, ident: Ident) -> bool:
-        return ident.value is not True and ident.name not in [q.name for q in self.queries]
-
-
     def idents_in_expr(self, expr):
-        if isinstance(expr, Ident):
-            return [expr]
-        if isinstance(expr, Not):
-            return self.idents_in_expr(expr.child)
-        if isinstance(expr, (And, Or, Xor)):
-            ids = []
-            for t in expr.terms:
-                ids.extend(self.idents_in_expr(t))
-            return ids
         if isinstance(expr, Implies):
-            return self.idents_in_expr(expr.premise) + self.idents_in_expr(expr.conclusion)
+            return idents_of(expr.premise) + idents_of(expr.conclusion)
         if isinstance(expr, Equiv):
-            return self.idents_in_expr(expr.left) + self.idents_in_expr(expr.right)
-        return []
-
-
-    def ident_in_expr(self, expr, goal):
-        return any(i.name == goal.name for i in self.idents_in_expr(expr))
+            return idents_of(expr.left) + idents_of(expr.right)
+        return idents_of(expr)
 
     # --------------------------------------------------
     # Propositional Logic
     # --------------------------------------------------
 
-    def eval_expr(self, expr, visited, depth=0):
-        if isinstance(expr, Ident):
-            if expr.name in visited:
-                return expr.value
-            value = self.prove(expr, visited, depth=depth+1)
-            return value
-
-        if isinstance(expr, Not):
-            v = self.eval_expr(expr.child, visited)
-            return None if v is None else not v
+    def conclude_ident(self, conclusion, conclusion_result, ident):
+        op = conclusion.op
 
-        if isinstance(expr, And):
-            vals = [self.eval_expr(t, visited, depth=depth+1) for t in expr.terms]
-            if any(v is False for v in vals):
-                return False
-            if any(v is None for v in vals):
-                return None
-            return True
-
-        if isinstance(expr, Or):
-            vals = [self.eval_expr(t, visited, depth=depth+1) for t in expr.terms]
-            if any(v is True for v in vals):
-                return True
-            if all(v is False for v in vals):
-                return False
-            return None
-
-        if isinstance(expr, Xor):
-            vals = [self.eval_expr(t, visited, depth=depth+1) for t in expr.terms]
-            result = False
-            for v in vals:
-                if v != None:
-                    result ^= v
-            return result
-
-        return None
-    
-
-    def conclude_ident(self, expr, conclusion_result, ident):
-        terms = expr.terms if hasattr(expr, "terms") else [expr]
-
-        # Peek helper: observe without proving / defaulting
-        def peek(expr):
-            if isinstance(expr, Ident):
-                return expr.value
-
-            if isinstance(expr, Not):
-                v = peek(expr.child)
-                return None if v is None else not v
-
-            if isinstance(expr, And):
-                vals = [peek(t) for t in expr.terms]
-                if any(v is False for v in vals):
-                    return False
-                if any(v is None for v in vals):
-                    return None
-                return True
-
-            if isinstance(expr, Or):
-                vals = [peek(t) for t in expr.terms]
-                if any(v is True for v in vals):
-                    return True
-                if all(v is False for v in vals):
-                    return False
-                return None
-
-            if isinstance(expr, Xor):
-                vals = [peek(t) for t in expr.terms]
-                if any(v is None for v in vals):
-                    return None
-                result = False
-                for v in vals:
-                    result ^= v
-                return result
-
-            return None
+        # Other terms of the conclusion, observed without proving / defaulting
+        def others():
+            for sid, peek in conclusion.terms:
+                if sid == ident.id:
+                    continue
+                yield peek()
 
         # ---------------- Ident ----------------
-        if isinstance(expr, Ident):
+        if op is Ident:
             return conclusion_result
 
         # ---------------- AND ----------------
-        if isinstance(expr, And):
+        if op is And:
             if conclusion_result is True:
                 # contradiction if any other term known false
-                for t in terms:
-                    if isinstance(t, Ident) and t.name == ident.name:
-                        continue
-                    if peek(t) is False:
+                for v in others():
+                    if v is False:
+                        if self.tracing:
+                            self.trace("contradiction", reason=f"in rule concluding {ident.name}")
                         raise ContradictionException(f"Contradiction detected in rule")
                 return True
 
             if conclusion_result is False:
                 # if all others known true → query must be false
-                all_true = True
-                for t in terms:
-                    if isinstance(t, Ident) and t.name == ident.name:
-                        continue
-                    if peek(t) is not True:
-                        all_true = False
-                        break
+                all_true = all(v is True for v in others())
                 return False if all_true else None
 
             return None
 
         # ---------------- OR ----------------
-        if isinstance(expr, Or):
+        if op is Or:
             if conclusion_result is False:
                 return False
 
             if conclusion_result is True:
                 # if all others known false → query true
-                all_false = True
-                for t in terms:
-                    if isinstance(t, Ident) and t.name == ident.name:
-                        continue
-                    if peek(t) is not False:
-                        all_false = False
-                        break
+                all_false = all(v is False for v in others())
                 return True if all_false else None
 
             return None
 
         # ---------------- XOR ----------------
-        if isinstance(expr, Xor):
+        if op is Xor:
             true_count = 0
             unknown = False
 
-            for t in terms:
-                if isinstance(t, Ident) and t.name == ident.name:
-                    continue
-                v = peek(t)
+            for v in others():
                 if v is True:
                     true_count += 1
                 elif v is None:
@@ -270,7 +403,7 @@ class Engine:
                 return None
 
         # ---------------- NOT ----------------
-        if isinstance(expr, Not):
+        if op is Not:
             return None if conclusion_result is None else not conclusion_result
 
         return None
@@ -280,68 +413,210 @@ class Engine:
     # Backward chaining over the graph
     # --------------------------------------------------
 
-    def prove(self, goal: Ident, visited=None, depth=0):
-        indent = "  " * depth
-        symbol_node = self.symbol_nodes[goal.name]
-        ident = symbol_node.ident
+    def prove(self, goal: Ident, depth=0):
+        value = self.lookup(goal, depth)
+        if value is not UNPROVEN:
+            return value
+
+        # One generator per goal being proven: a premise yields the goals it
+        # cannot look up, so derivations as deep as the rule base never
+        # nest Python frames
+        stack = [self.prove_steps(goal, depth)]
+        value = None
+        try:
+            while stack:
+                try:
+                    goal, depth = stack[-1].send(value)
+                except StopIteration as stop:
+                    stack.pop()
+                    value = stop.value
+                    continue
+                stack.append(self.prove_steps(goal, depth))
+                value = None
+        except BaseException:
+            # Unwind the goals still being proven, as recursion would
+            while stack:
+                stack.pop().close()
+            raise
+        return value
+
+
+    def lookup(self, goal: Ident, depth=0):
+        # Value of a goal that needs no proof, UNPROVEN otherwise
+        sid = goal.id
+        if self.profiling:
+            self.profiler.lookup(self.symtab.names[sid], depth)
 
         # Known value
-        if ident.value is not None:
-            self.log(f"{indent}{ident.name} known as {ident.value}")
-            return ident.value
+        value = self.facts.get(sid)
+        if value is not None:
+            if self.tracing:
+                self.trace("known", depth, symbol=self.symtab.names[sid], value=value)
+            return value
 
-        if visited is None:
-            visited = set()
+        # Already solved since the last fact change
+        if sid in self.table:
+            if self.tracing:
+                self.trace("cached", depth, symbol=self.symtab.names[sid], value=self.table[sid])
+            return self.table[sid]
+
+        # Solved, but relies on a goal that is still being proven
+        if sid in self.pending:
+            value, low = self.pending[sid]
+            self.cycle_low = min(self.cycle_low, low)
+            if self.tracing:
+                self.trace("cached", depth, symbol=self.symtab.names[sid], value=value)
+            return value
 
-        visited.add(ident.name)
-        results = []
+        # Cyclic goal: depend on the value of the goal being proven, the
+        # one its last evaluation gave if the cycle is being iterated
+        if sid in self.in_progress:
+            value = self.assumed.get(sid)
+            self.cycle_low = min(self.cycle_low, self.in_progress[sid])
+            if self.tracing:
+                self.trace("cycle", depth, symbol=self.symtab.names[sid], value=value)
+            return value
 
-        if symbol_node.produced_by_rules == [] and ident in self.queries:
+        if not self.symbol_nodes[sid].produced_by_rules and sid in self.query_ids:
             return False
+        return UNPROVEN
 
-        # Only rules that can produce this fact
-        for rn in symbol_node.produced_by_rules:
-            self.log(f"{indent}Trying rule for {goal.name}: {rn.original}")
 
-            rule = rn.rule
-            result = None
+    def prove_steps(self, goal: Ident, depth):
+        sid = goal.id
+        symbol_node = self.symbol_nodes[sid]
+        ident = symbol_node.ident
 
-            if isinstance(rule, Implies):
-                premise_og, conclusion_og = self.split_expression(rn.original)
+        position = len(self.in_progress)
+        self.in_progress[sid] = position
+        outer_low = self.cycle_low
+        mark = len(self.pending_stack)
+        if self.profiling:
+            started = self.profiler.clock()
+
+        # Re-evaluate a cycle leader with the value it was given until that
+        # value no longer changes, the goals that depended on it being
+        # proven again each time. A cycle that keeps flipping the value
+        # keeps the first one, its goals proven once more against it.
+        value = None
+        tried = []
+        try:
+            while True:
+                self.cycle_low = position + 1
+                result = yield from self.resolve_steps(symbol_node, depth, self.lookup)
+                if self.cycle_low != position or result is None or result == value:
+                    break
+                if result in tried:
+                    value = tried[0]
+                    self.assumed[sid] = value
+                    self.drop_pending(mark)
+                    self.cycle_low = position + 1
+                    yield from self.resolve_steps(symbol_node, depth, self.lookup)
+                    result = value
+                    break
+                tried.append(result)
+                value = result
+                self.assumed[sid] = result
+                self.drop_pending(mark)
+                if self.tracing:
+                    self.trace("cycle", depth, symbol=ident.name, value=result)
+        finally:
+            del self.in_progress[sid]
+            self.assumed.pop(sid, None)
+
+        if self.profiling:
+            stats = self.profiler.symbol(ident.name)
+            stats.proofs += 1
+            stats.time += self.profiler.clock() - started
+
+        if result is None:
+            result = value
+
+        if self.cycle_low >= position:
+            # Complete: the goal and every goal of its cycle are final
+            for other in self.pending_stack[mark:]:
+                self.table[other] = self.pending[other][0]
+                self.facts.set(other, self.table[other])
+            self.drop_pending(mark)
+            self.table[sid] = result
+            self.facts.set(sid, result)
+            self.cycle_low = outer_low
+        else:
+            self.pending[sid] = (result, self.cycle_low)
+            self.pending_stack.append(sid)
+            self.cycle_low = min(outer_low, self.cycle_low)
 
-                premise_value = self.eval_expr(rule.premise, visited, depth=depth+1)
-                self.log(f"{indent}Premise {premise_og} evaluated as {premise_value}")
+        if self.tracing:
+            self.trace("conclusion", depth, symbol=ident.name, value=result)
 
-                conclusion = rule.conclusion
-                conclusion_result = None
+        return result
 
-                if premise_value is True:
-                    conclusion_result = True
-                    self.log(f"{indent}Premise is True => {conclusion_og} should be True")
-                elif premise_value is False:
-                    conclusion_result = False
-                    self.log(f"{indent}Premise is False => {conclusion_og} default to False")
-                else:
-                    self.log(f"{indent}Premise is Unknown => {conclusion_og} remains undetermined")
 
-            elif isinstance(rule, Equiv):
-                left_og, right_og = self.split_expression(rn.original)
-                premise_og, conclusion_og = None, None
+    def drop_pending(self, mark):
+        for sid in self.pending_stack[mark:]:
+            del self.pending[sid]
+        del self.pending_stack[mark:]
 
-                if self.ident_in_expr(rule.left, ident):
-                    premise, conclusion = rule.right, rule.left
-                    premise_og, conclusion_og = right_og, left_og
-                else:
-                    premise, conclusion = rule.left, rule.right
-                    premise_og, conclusion_og = left_og, right_og
 
-                conclusion_result = self.eval_expr(premise, visited, depth + 1)
+    def resolve_rules(self, symbol_node, depth=0, lookup=None):
+        # Forward and scc chaining try the rules of a symbol here, profiled
+        # as one proof of it
+        steps = self.resolve_steps(symbol_node, depth, lookup or self.lookup)
+        if not self.profiling:
+            return run_steps(steps, self.prove)
+
+        started = self.profiler.clock()
+        try:
+            return run_steps(steps, self.prove)
+        finally:
+            stats = self.profiler.symbol(symbol_node.ident.name)
+            stats.proofs += 1
+            stats.time += self.profiler.clock() - started
 
-                self.log(f"{indent}Other side of Equiv {premise_og} evaluated as {conclusion_result}")
-                self.log(f"{indent}Using {rn.original} => {conclusion_og} = {conclusion_result}")
+
+    def resolve_steps(self, symbol_node, depth, lookup):
+        ident = symbol_node.ident
+        results = []
+
+        # Premises read without proving come from the flat storage, unless
+        # the profiler counts their lookups
+        flat = self.flat is not None and lookup == self.current_value and not self.profiling
+
+        # Only rules that can produce this fact, from the side concluding it
+        for production in symbol_node.productions:
+            rn = production.rule_node
+            if self.tracing:
+                self.trace("try_rule", depth, symbol=ident.name, rule=rn.original)
+
+            result = None
+
+            premise_lookup = lookup
+            if self.profiling:
+                stats = self.profiler.rule(rn)
+                stats.tried += 1
+                started = self.profiler.clock()
+                premise_lookup = self.profiler.counted(lookup, stats)
+            if self.tracing or self.profiling:
+                premise_lookup = observing(premise_lookup)
+
+            if flat:
+                conclusion_result = self.flat.evaluate(*production.span, self.facts)
+            else:
+                conclusion_result = yield from production.premise(premise_lookup, depth + 1)
+            if self.tracing:
+                # At the depth of the lookups it made
+                self.trace("premise", depth + 1, premise=production.premise_text,
+                           value=conclusion_result, conclusion=production.conclusion_text)
 
             if conclusion_result is not None:
-                result = self.conclude_ident(conclusion, conclusion_result, ident)
+                result = self.conclude_ident(production.conclusion, conclusion_result, ident)
+
+            if self.profiling:
+                stats.time += self.profiler.clock() - started
+                if result is None:
+                    stats.undetermined += 1
+                else:
+                    stats.determined += 1
 
             results.append(result)
 
@@ -349,110 +624,443 @@ class Engine:
         determined = [r for r in results if r is not None]
 
         if len(determined) > 1 and any(r != determined[0] for r in determined):
+            if self.tracing:
+                self.trace("contradiction", depth, reason=f"in rules for {ident.name}")
             raise ContradictionException(f"in rules for {ident.name}")
-        
-        if True in determined:
-            ident.value = True
-        elif False in determined:
-            ident.value = False
-        else:
-            ident.value = None
 
-        self.log(f"{indent}Conclusion: {ident.name} = {ident.value}")
-
-        return ident.value
+        if True in determined:
+            return True
+        if False in determined:
+            return False
+        return None
 
         
-    def update_ident_in_rule(self, ident):
-        # Get the symbol node for this ident
-        if ident.name not in self.symbol_nodes:
-            return
-        
-        self.symbols[ident.name].value = ident.value
-        self.symbol_nodes[ident.name].value = ident.value
-        
-        symbol_node = self.symbol_nodes[ident.name]
-        
-        # Update in rules that produce this symbol
-        for rn in symbol_node.produced_by_rules:
-            rule = rn.rule
-            if isinstance(rule, Implies):
-                self._update_expr_values(rule.premise, ident)
-                self._update_expr_values(rule.conclusion, ident)
-            elif isinstance(rule, Equiv):
-                self._update_expr_values(rule.left, ident)
-                self._update_expr_values(rule.right, ident)
-        
-        # Update in rules that use this symbol
-        for rn in symbol_node.used_in_rules:
-            rule = rn.rule
-            if isinstance(rule, Implies):
-                self._update_expr_values(rule.premise, ident)
-                self._update_expr_values(rule.conclusion, ident)
-            elif isinstance(rule, Equiv):
-                self._update_expr_values(rule.left, ident)
-                self._update_expr_values(rule.right, ident)
-
-
-    def _update_expr_values(self, expr, ident):
-        """Helper to update a specific ident in an expression"""
-        if isinstance(expr, Ident):
-            if expr.name == ident.name:
-                expr.value = ident.value
-        elif isinstance(expr, Not):
-            self._update_expr_values(expr.child, ident)
-        elif isinstance(expr, (And, Or, Xor)):
-            for t in expr.terms:
-                self._update_expr_values(t, ident)
-        elif isinstance(expr, Implies):
-            self._update_expr_values(expr.premise, ident)
-            self._update_expr_values(expr.conclusion, ident)
-        elif isinstance(expr, Equiv):
-            self._update_expr_values(expr.left, ident)
-            self._update_expr_values(expr.right, ident)
+    def set_value(self, sid, value):
+        self.facts.set(sid, value)
+        self.settled.set(sid, value)
 
+        # Tabled results may have relied on the previous value
+        if value is not None:
+            self.table.clear()
 
-    def backward_chaining(self):
-        try:
-            self.log("=== Backward Chaining Started ===\n")
 
-            self.log("=== Step 1: Deduce Queries ===\n")
-            for q in self.queries:
-                self.log(f"--- Proving query: {q.name} ---")
-                q.value = self.prove(q)
-                self.update_ident_in_rule(q)
-                self.log(f"Result for {q.name}: {q.value}\n")                
+    # --------------------------------------------------
+    # Fact updates on a resident engine
+    # --------------------------------------------------
 
-            self.log("=== Step 2: Deduce all non-initial facts ===\n")
+    def update_facts(self, changes):
+        # Change initial facts and forget every value a fresh run could give
+        # differently: the changed facts, undetermined and defaulted values,
+        # values that depend on when they are proven, and every value
+        # downstream of those. What is kept reads only kept values, so a
+        # fresh run proves it to the same value whenever it is asked for.
+        # Forward chaining fires rules in the order their inputs settle,
+        # which kept values would change, so it always starts over.
+        changed = []
+        for name, value in changes.items():
+            if name not in self.symtab:
+                raise ValueError(f"Unknown fact: {name}")
+            sid = self.symtab.ids[name]
+            if self.initial.get(sid) != value:
+                self.initial.set(sid, value)
+                changed.append(sid)
+
+        if self.strategy == "forward":
+            affected = set(range(len(self.symtab)))
+        else:
+            roots = set(changed) | self.defaulted
+            roots.update(sid for sid in range(len(self.symtab)) if self.facts.get(sid) is None)
+            roots.update(sid for sid in self.unsteady_symbols() if self.initial.get(sid) is None)
+            affected = self.downstream(roots)
+        self.reset_values(affected)
+        self.defaulted.clear()
+        self.evaluated = set()
+        return {self.symtab.names[sid] for sid in affected}
+
+
+    def downstream(self, ids):
+        # Symbols whose premises read any of ids, transitively
+        affected = set(ids)
+        todo = list(ids)
+        while todo:
+            for rn in self.symbol_nodes[todo.pop()].used_in_rules:
+                for i in rn.conclusion_idents:
+                    if i.id not in affected:
+                        affected.add(i.id)
+                        todo.append(i.id)
+        return affected
+
+
+    def unsteady_symbols(self):
+        # Symbols a proof can give another value depending on the step it
+        # runs in: those on a cycle, whose value depends on the goal the
+        # cycle was entered from, and those concluded next to other
+        # symbols, which observe the values committed so far
+        if self.unsteady is not None and self.unsteady[0] == len(self.rule_nodes):
+            return self.unsteady[1]
+
+        deps = []
+        found = set()
+        for sid, symbol_node in enumerate(self.symbol_nodes):
+            reads = set()
+            for production in symbol_node.productions:
+                if production.context in (And, Or, Xor):
+                    found.add(sid)
+                reads.update(i.id for i in self.idents_in_expr(production.premise_expr()))
+            if sid in reads:
+                found.add(sid)
+            deps.append(sorted(reads))
+        for component in strongly_connected_components(deps):
+            if len(component) > 1:
+                found.update(component)
+
+        self.unsteady = (len(self.rule_nodes), found)
+        return found
+
+
+    def reset_values(self, ids):
+        for sid in ids:
+            self.set_value(sid, self.initial.get(sid))
+
+        self.table.clear()
+        self.pending.clear()
+        self.pending_stack.clear()
+
+
+    def reset(self):
+        self.reset_values(range(len(self.symtab)))
+        self.defaulted.clear()
+        self.evaluated = set()
+
+
+    def fact_values(self, state=None):
+        state = state or self.facts
+        return {name: state.get(sid) for sid, name in enumerate(self.symtab.names)}
+
+
+    def cone_values(self):
+        # Values left by the last run: in goal-directed mode only the
+        # queries' cone is evaluated, other symbols are left out
+        return {
+            name: self.facts.get(sid) for sid, name in enumerate(self.symtab.names) if sid in self.cone
+        }
+
+
+    def value(self, name):
+        # Value of any symbol. In goal-directed mode a symbol outside the
+        # cone of the last run is evaluated when asked for, as backward
+        # chaining would if it were one more query: proven, the symbols its
+        # cone adds proven and defaulted, then proven again if still
+        # undetermined. The values the run left are then put back, so an
+        # answer does not depend on what was asked before.
+        sid = self.symtab.ids[name]
+        if sid in self.evaluated:
+            return self.facts.get(sid)
+
+        self.extend_cone([sid])
+        state = self.facts.copy()
+        goal = self.symbol_nodes[sid].ident
+        cone = self.cone_of(sid)
+        self.query_ids.add(sid)
+        try:
+            self.table.clear()
+            self.set_value(sid, self.prove(goal))
             for s in self.symbols.values():
-                if s not in self.queries and s.value is None:
-                    self.log(f"--- Proving non-initial fact: {s.name} ---")
+                if (s.id in cone and s.id != sid and s.id not in self.evaluated
+                        and self.facts.get(s.id) is None):
                     val = self.prove(s)
+                    self.set_value(s.id, False if val is None else val)
+            if self.settled.get(sid) is None:
+                self.set_value(sid, self.prove(goal))
+            return self.facts.get(sid)
+        finally:
+            self.query_ids.discard(sid)
+            for changed in self.facts.changed(state):
+                self.set_value(changed, state.get(changed))
+            self.table.clear()
+
+
+    def cone_of(self, sid):
+        # Ids of the symbols that can influence sid, through built rules
+        cone = {sid}
+        todo = [sid]
+        while todo:
+            for rn in self.symbol_nodes[todo.pop()].produced_by_rules:
+                for i in rn.premise_idents + rn.conclusion_idents:
+                    if i.id not in cone:
+                        cone.add(i.id)
+                        todo.append(i.id)
+        return cone
+
+
+    def results(self):
+        # Fresh identifiers carrying the query values, the parsed ones are left untouched
+        return [Ident(q.name, self.facts.get(q.id), q.id) for q in self.queries]
 
-                    if val is None:
-                        s.value = False
-                        self.log(f"{s.name} was undetermined → defaulted to False")
-                    else:
-                        s.value = val
-                        self.log(f"{s.name} determined as {s.value}")
 
-                    self.update_ident_in_rule(s)
-                    self.log("")
+    def backward_chaining(self):
+        tracing = self.tracing
+        if tracing:
+            self.trace("step", title="Backward Chaining Started")
+            self.trace("step", title="Step 1: Deduce Queries")
+        for q in self.queries:
+            if tracing:
+                self.trace("query", kind="query", symbol=q.name)
+            value = self.prove(q)
+            self.set_value(q.id, value)
+            if tracing:
+                self.trace("result", symbol=q.name, value=value)
+
+        if tracing:
+            self.trace("step", title="Step 2: Deduce all non-initial facts")
+        for s in self.symbols.values():
+            if s.id not in self.query_ids and self.facts.get(s.id) is None:
+                if tracing:
+                    self.trace("query", kind="non-initial fact", symbol=s.name)
+                val = self.prove(s)
+
+                if val is None:
+                    val = False
+                    self.defaulted.add(s.id)
+                    if tracing:
+                        self.trace("default", symbol=s.name, value=val)
+                elif tracing:
+                    self.trace("result", symbol=s.name, value=val)
+
+                self.set_value(s.id, val)
+
+        if tracing:
+            self.trace("step", title="Step 3: Re-evaluate Queries")
+        for q in self.queries:
+            if self.settled.get(q.id) is None:
+                if tracing:
+                    self.trace("query", kind="query again", symbol=q.name)
+                value = self.prove(q)
+                self.set_value(q.id, value)
+                if tracing:
+                    self.trace("result", symbol=q.name, value=value)
+
+        if tracing:
+            self.trace("step", title="Backward Chaining Completed")
+        return self.results()
 
-            self.log("=== Step 3: Re-evaluate Queries ===\n")
-            for q in self.queries:
-                if q.value is None:
-                    self.log(f"--- Re-proving query: {q.name} ---")
-                    q.value = self.prove(q)
-                    self.update_ident_in_rule(q)
-                    self.log(f"Final result for {q.name}: {q.value}\n")
 
-            self.log("=== Backward Chaining Completed ===\n")
+    # --------------------------------------------------
+    # Forward chaining over the graph
+    # --------------------------------------------------
 
-            if self.logging:
-                self.save_logs("reasoning.log")
+    def current_value(self, goal: Ident, depth=0):
+        # Premise lookup for forward chaining: values are read, never proven
+        if self.profiling:
+            self.profiler.lookup(self.symtab.names[goal.id], depth)
+        return self.facts.get(goal.id)
+
+
+    def settle(self, sid, value, open_symbols, watchers, pending, agenda):
+        open_symbols.discard(sid)
+        if value is not None:
+            self.set_value(sid, value)
+        if self.tracing:
+            self.trace("conclusion", 1, symbol=self.symtab.names[sid], value=value)
+
+        # Rules waiting on this symbol have one input less to wait for
+        for goal in watchers.get(sid, ()):
+            pending[goal] -= 1
+            if pending[goal] == 0 and goal in open_symbols:
+                agenda.append(goal)
+
+
+    def saturate(self, ids):
+        # Symbols still to decide, in a stable order for cycle breaking
+        order = [
+            sid for sid in ids
+            if self.facts.get(sid) is None and self.symbol_nodes[sid].produced_by_rules
+        ]
+        open_symbols = set(order)
+
+        # Per symbol: number of premise inputs of its rules that are not
+        # settled yet
+        pending = dict.fromkeys(order, 0)
+        watchers = {}
+        for sid in order:
+            for dep in self.dependencies(sid):
+                if dep in open_symbols:
+                    pending[sid] += 1
+                    watchers.setdefault(dep, []).append(sid)
+
+        agenda = deque(n for n in order if pending[n] == 0)
+        args = (open_symbols, watchers, pending, agenda)
+
+        while open_symbols:
+            while agenda:
+                sid = agenda.popleft()
+                if sid in open_symbols:
+                    if self.tracing:
+                        self.trace("fire", 1, symbol=self.symtab.names[sid])
+                    value = self.resolve_rules(self.symbol_nodes[sid], 1, self.current_value)
+                    self.settle(sid, value, *args)
+
+            if not open_symbols:
+                break
+
+            # Cycle: settle what the current values already determine
+            if self.tracing:
+                cycle = ", ".join(self.symtab.names[sid] for sid in order if sid in open_symbols)
+                self.trace("cycle", 1, symbol=cycle, value=None)
+            # All symbols of the cycle are evaluated against the same values
+            # before any is settled, so the result does not depend on order
+            determined = []
+            for sid in order:
+                if sid in open_symbols:
+                    value = self.resolve_rules(self.symbol_nodes[sid], 1, self.current_value)
+                    if value is not None:
+                        determined.append((sid, value))
+            for sid, value in determined:
+                self.settle(sid, value, *args)
+
+            if not determined:
+                for sid in order:
+                    if sid in open_symbols:
+                        self.settle(sid, None, *args)
+
+
+    def forward_chaining(self):
+        tracing = self.tracing
+        if tracing:
+            self.trace("step", title="Forward Chaining Started")
+
+        # Queries that no rule produces are False
+        for q in self.queries:
+            if not self.symbol_nodes[q.id].produced_by_rules and self.facts.get(q.id) is None:
+                self.set_value(q.id, False)
+
+        if tracing:
+            self.trace("step", title="Step 1: Fire rules from the initial facts")
+        self.saturate([s.id for s in self.symbols.values()])
+
+        if tracing:
+            self.trace("step", title="Step 2: Deduce all non-initial facts")
+        for s in self.symbols.values():
+            if s.id not in self.query_ids and self.facts.get(s.id) is None:
+                self.set_value(s.id, False)
+                self.defaulted.add(s.id)
+                if tracing:
+                    self.trace("default", symbol=s.name, value=False)
+
+        if tracing:
+            self.trace("step", title="Step 3: Re-evaluate Queries")
+        self.saturate([q.id for q in self.queries])
+
+        if tracing:
+            self.trace("step", title="Forward Chaining Completed")
+        return self.results()
 
-        except Exception:
-            raise
 
-        return self.queries
+    # --------------------------------------------------
+    # Component scheduling
+    # --------------------------------------------------
+
+    def dependencies(self, sid):
+        # Symbols the premises concluding sid read. Other terms of a
+        # conclusion are only observed, depending on them would join
+        # symbols concluded together into cycles that do not exist.
+        # A known symbol is never resolved, so it depends on nothing and
+        # closes no cycle.
+        deps = set()
+        if self.facts.get(sid) is not None:
+            return deps
+        for production in self.symbol_nodes[sid].productions:
+            for i in self.idents_in_expr(production.premise_expr()):
+                deps.add(i.id)
+        deps.discard(sid)
+        return deps
+
+
+    def strongly_connected_components(self):
+        # Edges go from a symbol to its dependencies
+        n = len(self.symbol_nodes)
+        return strongly_connected_components([sorted(self.dependencies(sid)) for sid in range(n)])
+
+
+    def fixpoint(self, open_ids):
+        # Settle what the current values determine, all members being
+        # evaluated against the same values, until nothing changes
+        while open_ids:
+            determined = []
+            for sid in open_ids:
+                value = self.resolve_rules(self.symbol_nodes[sid], 1, self.current_value)
+                if value is not None:
+                    determined.append((sid, value))
+            if not determined:
+                return open_ids
+            for sid, value in determined:
+                self.set_value(sid, value)
+                if self.tracing:
+                    self.trace("conclusion", 1, symbol=self.symtab.names[sid], value=value)
+            settled = {sid for sid, _ in determined}
+            open_ids = [sid for sid in open_ids if sid not in settled]
+        return open_ids
+
+
+    def scc_chaining(self):
+        # Components in dependency order: every symbol is resolved after all
+        # it depends on, with fixpoint iteration only inside cycles
+        tracing = self.tracing
+        if tracing:
+            self.trace("step", title="Component Scheduling Started")
+
+        key = self.facts.key()
+        if self.components is None or self.components[0] != key:
+            self.components = (key, self.strongly_connected_components())
+        components = self.components[1]
+
+        for q in self.queries:
+            if not self.symbol_nodes[q.id].produced_by_rules and self.facts.get(q.id) is None:
+                self.set_value(q.id, False)
+
+        if tracing:
+            self.trace("step", title="Step 1: Settle components from the initial facts")
+        self.settle_components(components, lambda sid: True)
+
+        if tracing:
+            self.trace("step", title="Step 2: Deduce all non-initial facts")
+        for s in self.symbols.values():
+            if s.id not in self.query_ids and self.facts.get(s.id) is None:
+                self.set_value(s.id, False)
+                self.defaulted.add(s.id)
+                if tracing:
+                    self.trace("default", symbol=s.name, value=False)
+
+        if tracing:
+            self.trace("step", title="Step 3: Re-evaluate Queries")
+        self.settle_components(components, self.query_ids.__contains__)
+
+        if tracing:
+            self.trace("step", title="Component Scheduling Completed")
+        return self.results()
+
+
+    def settle_components(self, components, wanted):
+        for component in components:
+            open_ids = [
+                sid for sid in component
+                if wanted(sid)
+                and self.facts.get(sid) is None
+                and self.symbol_nodes[sid].produced_by_rules
+            ]
+            if not open_ids:
+                continue
+            if self.tracing:
+                names = ", ".join(self.symtab.names[sid] for sid in open_ids)
+                self.trace("fire", 1, symbol=names)
+            self.fixpoint(open_ids)
+
+
+    def run(self, strategy="backward"):
+        self.evaluated = set(self.cone)
+        self.strategy = strategy
+        if strategy == "forward":
+            return self.forward_chaining()
+        if strategy == "scc":
+            return self.scc_chaining()
+        return self.backward_chaining()
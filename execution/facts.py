@@ -0,0 +1,77 @@
+# --------------------------------------------------
+# Bitset fact state
+# --------------------------------------------------
+# Three-valued facts stored as two integers, bit i for symbol id i:
+# - known:  bit set when the symbol is True or False
+# - values: bit set when the symbol is True (only meaningful if known)
+
+
+class FactState:
+    def __init__(self, size):
+        self.size = size
+        self.known = 0
+        self.values = 0
+
+    def bit(self, sid):
+        return 1 << sid
+
+    def mask(self, ids):
+        m = 0
+        for sid in ids:
+            m |= 1 << sid
+        return m
+
+    def get(self, sid):
+        b = 1 << sid
+        if not self.known & b:
+            return None
+        return bool(self.values & b)
+
+    def set(self, sid, value):
+        b = 1 << sid
+        if value is None:
+            self.known &= ~b
+            self.values &= ~b
+        elif value:
+            self.known |= b
+            self.values |= b
+        else:
+            self.known |= b
+            self.values &= ~b
+
+    # ----- Mask checks -----
+
+    def all_known(self, mask):
+        return self.known & mask == mask
+
+    def all_true(self, mask):
+        return self.known & self.values & mask == mask
+
+    def any_true(self, mask):
+        return self.known & self.values & mask != 0
+
+    def count_true(self, mask):
+        return bin(self.known & self.values & mask).count("1")
+
+    # ----- Snapshots -----
+
+    def copy(self):
+        state = FactState.__new__(FactState)
+        state.size = self.size
+        state.known = self.known
+        state.values = self.values
+        return state
+
+    def changed(self, other):
+        # Ids whose value differs between the two states
+        diff = (self.known ^ other.known) | (self.values ^ other.values)
+        return [sid for sid in range(self.size) if diff >> sid & 1]
+
+    def key(self):
+        return (self.known, self.values)
+
+    def __eq__(self, other):
+        return isinstance(other, FactState) and self.key() == other.key()
+
+    def __hash__(self):
+        return hash(self.key())
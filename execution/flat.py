@@ -0,0 +1,98 @@
+from array import array
+
+from parsing.data import *
+
+# --------------------------------------------------
+# Flat postfix rule storage
+# --------------------------------------------------
+# Every rule of an engine stored in a few contiguous arrays instead of
+# expression objects, one entry per node in postfix order (children first):
+# - ops:   opcode of the node
+# - args:  symbol id of an identifier, number of children of an operator
+# Rule r spans nodes offsets[r] to offsets[r + 1], its premise (or left
+# side) ending at splits[r], where its conclusion (or right side) starts.
+# The arrays are built next to the rule ASTs and compiled closures. Forward
+# and scc chaining read premises from them when nothing has to be proven;
+# backward chaining proves premises from the closures and never reads them.
+
+IDENT, NOT, AND, OR, XOR = range(5)
+OPCODES = {Not: NOT, And: AND, Or: OR, Xor: XOR}
+
+IMPLIES, EQUIV = range(2)
+
+
+class FlatRules:
+    def __init__(self):
+        self.ops = array("B")
+        self.args = array("I")
+        self.kinds = array("B")
+        self.offsets = array("I", [0])
+        self.splits = array("I")
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def append(self, rule):
+        """Store rule, returning its index"""
+        if isinstance(rule, Implies):
+            first, second, kind = rule.premise, rule.conclusion, IMPLIES
+        else:
+            first, second, kind = rule.left, rule.right, EQUIV
+        self.write(first)
+        self.splits.append(len(self.ops))
+        self.write(second)
+        self.offsets.append(len(self.ops))
+        self.kinds.append(kind)
+        return len(self.kinds) - 1
+
+    def write(self, expr):
+        # Postfix order with an explicit stack, for arbitrarily deep premises
+        todo = [(expr, False)]
+        while todo:
+            e, done = todo.pop()
+            if isinstance(e, Ident):
+                self.ops.append(IDENT)
+                self.args.append(e.id)
+            elif done:
+                self.ops.append(OPCODES[type(e)])
+                self.args.append(1 if isinstance(e, Not) else len(e.terms))
+            else:
+                todo.append((e, True))
+                children = (e.child,) if isinstance(e, Not) else e.terms
+                todo.extend((t, False) for t in reversed(children))
+
+    def sides(self, index):
+        """Node ranges of the first and second side of rule index"""
+        split = self.splits[index]
+        return (self.offsets[index], split), (split, self.offsets[index + 1])
+
+    def evaluate(self, start, end, facts):
+        """Premise value of nodes start to end against facts: True/False/None
+
+        Same values as the compiled premise read without proving: And / Or
+        are undetermined only if no term decides them, Xor ignores its
+        undetermined terms."""
+        known, values = facts.known, facts.values
+        if end - start == 1:
+            sid = self.args[start]
+            return bool(values >> sid & 1) if known >> sid & 1 else None
+
+        stack = []
+        for op, arg in zip(self.ops[start:end], self.args[start:end]):
+            if op == IDENT:
+                stack.append(bool(values >> arg & 1) if known >> arg & 1 else None)
+            elif op == NOT:
+                v = stack[-1]
+                if v is not None:
+                    stack[-1] = not v
+            else:
+                vals = stack[-arg:]
+                del stack[-arg:]
+                if op == AND:
+                    v = False if False in vals else None if None in vals else True
+                elif op == OR:
+                    v = True if True in vals else None if None in vals else False
+                else:
+                    v = vals.count(True) % 2 == 1
+                stack.append(v)
+        return stack[0]
@@ -0,0 +1,105 @@
+import json
+from time import perf_counter
+
+
+# --------------------------------------------------
+# Inference profiling
+# --------------------------------------------------
+# Times are inclusive: a rule's time contains the proofs of its premise,
+# a symbol's time contains the rules it tried.
+
+class RuleStats:
+    __slots__ = ("tried", "premise_evals", "determined", "undetermined", "time")
+
+    def __init__(self):
+        self.tried = 0
+        self.premise_evals = 0      # identifiers evaluated by the premise
+        self.determined = 0         # tries giving the goal a value
+        self.undetermined = 0
+        self.time = 0.0
+
+
+class SymbolStats:
+    __slots__ = ("lookups", "proofs", "time")
+
+    def __init__(self):
+        self.lookups = 0            # every lookup of the symbol
+        self.proofs = 0             # calls that had to try rules
+        self.time = 0.0
+
+
+class Profiler:
+    def __init__(self):
+        self.rules = {}
+        self.symbols = {}
+        self.max_depth = 0
+        self.clock = perf_counter
+
+    def rule(self, rn):
+        stats = self.rules.get(rn)
+        if stats is None:
+            stats = self.rules[rn] = RuleStats()
+        return stats
+
+    def symbol(self, name):
+        stats = self.symbols.get(name)
+        if stats is None:
+            stats = self.symbols[name] = SymbolStats()
+        return stats
+
+    def counted(self, lookup, stats):
+        # lookup, counting the identifiers a premise evaluates
+        def counting(goal, depth):
+            stats.premise_evals += 1
+            return lookup(goal, depth)
+        return counting
+
+    def lookup(self, name, depth):
+        self.symbol(name).lookups += 1
+        if depth > self.max_depth:
+            self.max_depth = depth
+
+    # ----- Reports -----
+
+    def report(self, engine):
+        rules = []
+        for index, rn in enumerate(engine.rule_nodes):
+            stats = self.rules.get(rn, RuleStats())
+            rules.append({
+                "index": index,
+                "rule": rn.original,
+                "tried": stats.tried,
+                "premise_evals": stats.premise_evals,
+                "determined": stats.determined,
+                "undetermined": stats.undetermined,
+                "time": stats.time,
+            })
+        rules.sort(key=lambda r: (-r["time"], r["index"]))
+
+        symbols = [
+            {"symbol": name, "lookups": s.lookups, "proofs": s.proofs, "time": s.time}
+            for name, s in self.symbols.items()
+        ]
+        symbols.sort(key=lambda s: (-s["time"], s["symbol"]))
+
+        return {"max_depth": self.max_depth, "rules": rules, "symbols": symbols}
+
+    def write_json(self, engine, path):
+        with open(path, "w") as f:
+            json.dump(self.report(engine), f, indent=2)
+
+
+def format_report(report, top=20):
+    lines = [f"Max proof depth: {report['max_depth']}", "", "Rules (by cumulative time):"]
+    lines.append(f"  {'time ms':>9} {'tried':>7} {'evals':>7} {'det':>6} {'undet':>6}  rule")
+    for r in report["rules"][:top]:
+        lines.append(
+            f"  {r['time'] * 1000:9.3f} {r['tried']:7d} {r['premise_evals']:7d} "
+            f"{r['determined']:6d} {r['undetermined']:6d}  {r['rule']}"
+        )
+
+    lines += ["", "Symbols (by cumulative time):"]
+    lines.append(f"  {'time ms':>9} {'lookups':>7} {'proofs':>7}  symbol")
+    for s in report["symbols"][:top]:
+        lines.append(f"  {s['time'] * 1000:9.3f} {s['lookups']:7d} {s['proofs']:7d}  {s['symbol']}")
+    return "\n".join(lines)
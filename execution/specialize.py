@@ -0,0 +1,249 @@
+from parsing.data import *
+from parsing.file_utils import parse_input_text
+from parsing.parser import pretty_expr
+from execution.exec import strongly_connected_components
+
+
+# --------------------------------------------------
+# Partial evaluation against fixed facts
+# --------------------------------------------------
+# Facts shared by many runs are folded into the rule base once:
+# - premises are simplified with the fixed facts as constants
+# - rules only concluding fixed facts are dropped, the engine never tries them
+# - a premise that is now always True asserts its conclusion as a fact when
+#   the conclusion is a plain symbol no other rule produces
+# - an equivalence with one side fixed becomes an implication from that side
+# Inside a cycle a premise can be read before all of its inputs are known,
+# and what it concludes then depends on when and in which order its terms
+# are read. Only rules whose symbols all settle outside of any cycle are
+# rewritten, rules a cycle reaches are kept as written.
+# A premise with no smaller form of the same value is kept as written too:
+# one now always False, as the engine concludes False from it, which can
+# still contradict other rules, one always True that cannot be asserted,
+# and an Xor left with a single term, as the premise Xor ignores it when
+# it is undetermined.
+
+
+class SpecializeStats:
+    def __init__(self, rules_before):
+        self.rules_before = rules_before
+        self.rules_after = 0
+        self.rewritten = 0          # residual rules rewritten
+        self.dropped = 0            # rules only concluding fixed facts
+        self.asserted = []          # symbols turned into facts
+
+    def summary(self):
+        return (
+            f"Specialized {self.rules_before} rules into {self.rules_after}: "
+            f"{self.rewritten} rules rewritten, {self.dropped} rules dropped, "
+            f"{len(self.asserted)} conclusions asserted as facts"
+        )
+
+
+class Residual:
+    def __init__(self, lines, stats):
+        self.lines = lines
+        self.stats = stats
+
+    def parse(self):
+        return parse_input_text("\n".join(self.lines))
+
+    def write(self, path):
+        with open(path, "w") as f:
+            f.write("\n".join(self.lines) + "\n")
+
+
+def fold(expr, known):
+    """expr with the known symbols as True: True, False, a smaller expression,
+    or None when no expression without them has the same value"""
+    return walk(fold_step, expr, known)
+
+
+def fold_step(expr, known):
+    # One node of fold, run by walk: each yield folds a child
+    if isinstance(expr, Ident):
+        return True if expr.name in known else expr
+
+    if isinstance(expr, Not):
+        child = yield expr.child, known
+        if child is True or child is False:
+            return not child
+        if child is None:
+            return None
+        return expr if child is expr.child else Not(child)
+
+    terms = []
+    for t in expr.terms:
+        terms.append((yield t, known))
+    rest = [t for t in terms if t is not True and t is not False]
+
+    if isinstance(expr, Xor):
+        # Undetermined terms are ignored by the premise Xor, so a single
+        # remaining term is not the Xor itself, and an odd number of
+        # folded terms negates the Xor of the others
+        parity = terms.count(True) % 2 == 1
+        if not rest:
+            return parity
+        if None in rest or len(rest) == 1:
+            return None
+        if parity:
+            return Not(Xor(tuple(rest)))
+        return expr if len(rest) == len(terms) and all(
+            a is b for a, b in zip(rest, expr.terms)) else Xor(tuple(rest))
+
+    decisive = isinstance(expr, Or)
+    if decisive in terms:
+        return decisive
+    if None in rest:
+        return None
+    if not rest:
+        return not decisive
+    if len(rest) == 1:
+        return rest[0]
+    if len(rest) == len(terms) and all(a is b for a, b in zip(rest, expr.terms)):
+        return expr
+    return type(expr)(tuple(rest))
+
+
+def names_in(expr):
+    return {i.name for i in idents_of(expr)}
+
+
+def rule_names(rule):
+    if isinstance(rule, Implies):
+        return names_in(rule.premise) | names_in(rule.conclusion)
+    return names_in(rule.left) | names_in(rule.right)
+
+
+def order_free(pr, fixed):
+    # Names of the symbols whose value does not depend on the order rules
+    # are tried in: outside of any cycle, as the engine schedules them, and
+    # only concluded alone, as a conclusion also reads its other symbols.
+    # As in the engine, a symbol depends on the premises concluding it and
+    # a fixed one on nothing.
+    ids = pr.symtab.ids
+    deps = [set() for _ in range(len(pr.symtab))]
+    shared = set()
+    for rule in pr.rules:
+        if isinstance(rule, Implies):
+            sides = [(rule.premise, rule.conclusion)]
+        else:
+            sides = [(rule.right, rule.left), (rule.left, rule.right)]
+        for premise, conclusion in sides:
+            names = names_in(conclusion)
+            if len(names) > 1:
+                shared |= names
+            inputs = {ids[name] for name in names_in(premise)}
+            for name in names - fixed:
+                deps[ids[name]] |= inputs
+
+    free = set()
+    for sid, inputs in enumerate(deps):
+        inputs.discard(sid)
+    for component in strongly_connected_components([sorted(d) for d in deps]):
+        sid = component[0]
+        name = pr.symtab.names[sid]
+        if len(component) == 1 and (name in fixed or name not in shared) and deps[sid] <= free:
+            free.add(sid)
+    return {pr.symtab.names[sid] for sid in free}
+
+
+def specialize(pr: ParseResult, facts=None) -> Residual:
+    """Residual rule base of pr with facts (default: its initial facts) folded in"""
+    fixed = set(pr.initial_facts if facts is None else facts)
+    known = set(fixed)
+    steady = order_free(pr, fixed)
+    stats = SpecializeStats(len(pr.rules))
+    # Each residual rule with the rule it comes from. Rules dropped or
+    # asserted are spare, with whether they were dropped: the engine would
+    # never try them
+    entries = [(rule, text, (rule, text)) for rule, text in zip(pr.rules, pr.original_rules)]
+    spare = []
+
+    # Asserting a conclusion can decide more premises, until nothing changes
+    changed = True
+    while changed:
+        changed = False
+        producers = {}
+        for rule, _, _ in entries:
+            sides = [rule.conclusion] if isinstance(rule, Implies) else [rule.left, rule.right]
+            for name in set().union(*(names_in(side) for side in sides)):
+                producers[name] = producers.get(name, 0) + 1
+
+        residual = []
+        for rule, text, origin in entries:
+            if not rule_names(rule) <= steady:
+                residual.append((rule, text, origin))
+                continue
+
+            if isinstance(rule, Equiv):
+                left, right = names_in(rule.left), names_in(rule.right)
+                if left | right <= known:
+                    stats.dropped += 1
+                    spare.append((origin, True))
+                    continue
+                if left <= known or right <= known:
+                    premise, conclusion = (rule.left, rule.right) if left <= known else (rule.right, rule.left)
+                    rule = Implies(premise, conclusion)
+                    text = f"{pretty_expr(premise)} => {pretty_expr(conclusion)}"
+                    changed = True
+                residual.append((rule, text, origin))
+                continue
+
+            if names_in(rule.conclusion) <= known:
+                stats.dropped += 1
+                spare.append((origin, True))
+                continue
+
+            premise = fold(rule.premise, known)
+            conclusion = rule.conclusion
+            if premise is True and isinstance(conclusion, Ident) and producers[conclusion.name] == 1:
+                stats.asserted.append(conclusion.name)
+                known.add(conclusion.name)
+                spare.append((origin, False))
+                changed = True
+                continue
+
+            if premise is True or premise is False or premise is None:
+                premise = rule.premise
+            if premise is not rule.premise:
+                rule = Implies(premise, rule.conclusion)
+                text = f"{pretty_expr(premise)} => {pretty_expr(rule.conclusion)}"
+            residual.append((rule, text, origin))
+        entries = residual
+
+    # A word names a multi-letter symbol only if a rule uses it, and a rule
+    # base needs a rule: a query no residual rule mentions any more gets
+    # back a rule it comes from, which concludes as its residual rule does
+    # or, dropped or asserted, is never tried
+    queries = [q.name for q in pr.queries]
+    used = set().union(*(rule_names(rule) for rule, _, _ in entries))
+    for name in queries:
+        if name in used or (len(name) == 1 and entries):
+            continue
+        found = [i for i, (_, _, origin) in enumerate(entries) if name in rule_names(origin[0])]
+        if found:
+            origin = entries[found[0]][2]
+            entries[found[0]] = (*origin, origin)
+        else:
+            origin, dropped = next(
+                s for s in spare if name in rule_names(s[0][0]) or not entries
+            )
+            spare.remove((origin, dropped))
+            stats.dropped -= dropped
+            entries.append((*origin, origin))
+        used |= rule_names(origin[0])
+
+    stats.rewritten = sum(rule is not origin[0] for rule, _, origin in entries)
+
+    # Identical residual rules would be reported as duplicates
+    texts = list(dict.fromkeys(text for _, text, _ in entries))
+
+    # Facts no rule mentions any more cannot change any result
+    facts_line = sorted(
+        name for name in known | set(pr.initial_facts) if name in used or name in queries
+    )
+
+    stats.rules_after = len(texts)
+    lines = texts + ["", "=" + " ".join(facts_line), "?" + " ".join(queries)]
+    return Residual(lines, stats)
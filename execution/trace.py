@@ -0,0 +1,87 @@
+import json
+import sys
+
+# Trace levels: an event is emitted when its level is <= the tracer level
+OFF = 0
+INFO = 1
+DEBUG = 2
+
+LEVELS = {"off": OFF, "info": INFO, "debug": DEBUG}
+
+
+# --------------------------------------------------
+# Events
+# --------------------------------------------------
+# Each event type has a level and a text template over its fields.
+# Events also carry the proof depth, rendered as indentation.
+
+EVENTS = {
+    "step":          (INFO,  "=== {title} ===\n"),
+    "query":         (INFO,  "--- Proving {kind}: {symbol} ---"),
+    "result":        (INFO,  "Result for {symbol}: {value}\n"),
+    "default":       (INFO,  "{symbol} was undetermined → defaulted to {value}\n"),
+    "conclusion":    (INFO,  "Conclusion: {symbol} = {value}"),
+    "contradiction": (INFO,  "Contradiction {reason}"),
+    "known":         (DEBUG, "{symbol} known as {value}"),
+    "cached":        (DEBUG, "{symbol} already proven as {value}"),
+    "cycle":         (DEBUG, "{symbol} is part of a cycle, using {value}"),
+    "try_rule":      (DEBUG, "Trying rule for {symbol}: {rule}"),
+    "premise":       (DEBUG, "Premise {premise} evaluated as {value} => {conclusion}"),
+    "fire":          (DEBUG, "Firing rules for {symbol}"),
+}
+
+
+# --------------------------------------------------
+# Sinks
+# --------------------------------------------------
+
+class TextSink:
+    """Human readable lines, as the former reasoning.log"""
+
+    def __init__(self, stream, close=False):
+        self.stream = stream
+        self.owned = close
+
+    def write(self, event, depth, fields):
+        text = EVENTS[event][1].format(**fields)
+        self.stream.write("  " * depth + text + "\n")
+
+    def close(self):
+        if self.owned:
+            self.stream.close()
+        else:
+            self.stream.flush()
+
+
+class JsonlSink(TextSink):
+    """One JSON object per event"""
+
+    def write(self, event, depth, fields):
+        record = {"event": event, "depth": depth}
+        record.update(fields)
+        self.stream.write(json.dumps(record) + "\n")
+
+
+class Tracer:
+    def __init__(self, sink, level=INFO):
+        self.sink = sink
+        self.level = level
+
+    def emit(self, event, depth=0, **fields):
+        if EVENTS[event][0] <= self.level:
+            self.sink.write(event, depth, fields)
+
+    def close(self):
+        self.sink.close()
+
+
+def open_tracer(target, level=INFO):
+    """Tracer for "-" (stdout), a .jsonl file (JSON lines) or any other file (text)"""
+    if level == OFF:
+        return None
+    if target in (None, "-"):
+        return Tracer(TextSink(sys.stdout), level)
+    stream = open(target, "w", encoding="utf-8")
+    if target.endswith(".jsonl"):
+        return Tracer(JsonlSink(stream, close=True), level)
+    return Tracer(TextSink(stream, close=True), level)
@@ -1,12 +1,22 @@
 import argparse
+import csv
 import sys
 import os
-from typing import Dict, Iterable, List, Optional
-from parsing.data import Ident
-from parsing.file_utils import parser, parse_input_lines, read_lines_from_file
+from typing import Dict, Optional
+from parsing.file_utils import parser
 from execution.exec import Engine
 from execution.exec import Engine, ContradictionException
-from tester.tester import Colors, print_summary, run_test, run_contradiction_test, tests, contradiction_tests
+from execution.cache import load_cached_engine
+from execution.trace import LEVELS, open_tracer
+from execution.profile import Profiler, format_report
+from execution.specialize import specialize
+from execution import batch
+from bench.bench import run_bench
+from tester.tester import (
+    Colors, print_summary, run_cases, write_report,
+    tests, contradiction_tests, error_tests, update_tests, batch_tests, prune_tests,
+    value_tests, specialize_tests, profile_tests, strategy_tests,
+)
 
 
 def parse_args():
@@ -26,92 +36,234 @@ def parse_args():
         action="store_true",
         help="Launch the tester to verify execution.",
     )
+    parser.add_argument(
+        "--bench",
+        action="store_true",
+        help="Run the benchmark suite on generated rule bases.",
+    )
+    parser.add_argument(
+        "--bench-sizes",
+        default=None,
+        help="Comma-separated rule base sizes for --bench (default: 100,1000,10000).",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=None,
+        help="Worker processes for --tester (default: one per CPU).",
+    )
+    parser.add_argument(
+        "--report",
+        default=None,
+        metavar="FILE",
+        help="Write the --tester results to FILE, as JUnit XML for .xml files, JSON otherwise.",
+    )
     parser.add_argument(
         "--logs",
         action="store_true",
         default=False,
         help="Display reasoning logs to understand the solutions.",
     )
+    parser.add_argument(
+        "--trace",
+        default=None,
+        metavar="FILE",
+        help="Stream reasoning events to FILE ('-' for stdout, .jsonl for JSON lines).",
+    )
+    parser.add_argument(
+        "--trace-level",
+        choices=list(LEVELS),
+        default=None,
+        help="Events to trace: info (steps and conclusions) or debug (every rule tried).",
+    )
+    parser.add_argument(
+        "--strategy",
+        choices=["backward", "forward", "scc"],
+        default="backward",
+        help="Inference strategy: prove queries backward, fire rules forward from the facts, or settle dependency components in order (scc).",
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="profile.json",
+        default=None,
+        metavar="FILE",
+        help="Report per-rule and per-symbol inference metrics, also written as JSON to FILE (profile.json).",
+    )
+    parser.add_argument(
+        "--prune",
+        action="store_true",
+        help="Goal-directed mode: only build and evaluate rules that can influence the queries.",
+    )
+    parser.add_argument(
+        "--flat",
+        action="store_true",
+        help="Evaluate premises from flat postfix arrays in forward and scc chaining. "
+        "Backward chaining ignores this option.",
+    )
+    parser.add_argument(
+        "--batch",
+        default=None,
+        metavar="CSV",
+        help="Evaluate an acyclic rule base once per row of CSV: a header of symbol names, then 1, 0 or nothing per symbol as the initial facts of that row.",
+    )
+    parser.add_argument(
+        "--specialize",
+        default=None,
+        metavar="FILE",
+        help="Fold the initial facts into the rules and write the residual rule base to FILE.",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=None,
+        help="Directory caching parsed and built rule bases between runs.",
+    )
     return parser.parse_args()
 
 
-def run_main(pr, file_path, logging):
-    engine = Engine(pr, logging)
-    results = engine.backward_chaining()
+def load_engine(file_path, tracer=None, cache_dir=None, prune=False, flat=False):
+    if cache_dir:
+        return load_cached_engine(file_path, cache_dir, tracer, prune, flat)
+    return Engine(parser(file_path), tracer, prune, flat)
 
-    # Display the logs
+
+def make_tracer(args):
+    # --logs streams the whole reasoning to stdout, --trace picks the sink
+    level = args.trace_level
+    if level is None:
+        level = "debug" if args.logs or args.trace else "off"
+    return open_tracer(args.trace, LEVELS[level])
+
+
+def run_main(engine, file_path, logging, strategy="backward", profile=None):
+    # The trace is streamed while the engine runs, after the original file
     if logging:
         with open(file_path, "r") as f:
             print(f.read())
-        with open("reasoning.log", "r") as f:
-            print(f.read())
+        if engine.normalization:
+            print(engine.normalization.summary() + "\n")
+
+    if profile:
+        engine.set_profiler(Profiler())
+
+    results = engine.run(strategy)
 
     print("Query results:")
     for q in results:
         print(f"  {q.name}: {q.value}")
 
+    if profile:
+        print()
+        print(format_report(engine.profiler.report(engine)))
+        engine.profiler.write_json(engine, profile)
+        print(f"\nProfile written to {profile}")
+
 
-def run_tester():
-    summary = []
+def run_tester(strategy="backward", jobs=None, report=None):
+    cases = []
 
     # Normal tests
     for file_path, expected in tests.items():
         if os.path.exists(file_path):
-            result = run_test(file_path, expected)
-            summary.append(result)
+            cases.append(("results", file_path, expected, strategy))
+        else:
+            print(f"{Colors.YELLOW}⚠️ File not found: {file_path}{Colors.END}")
+
+    # Tests expecting other results from each strategy
+    for file_path, expected in strategy_tests.get(strategy, {}).items():
+        if os.path.exists(file_path):
+            cases.append(("results", file_path, expected, strategy))
         else:
             print(f"{Colors.YELLOW}⚠️ File not found: {file_path}{Colors.END}")
 
     # Contradiction tests
     for file_path in contradiction_tests:
         if os.path.exists(file_path):
-            result = run_contradiction_test(file_path)
-            summary.append(result)
+            cases.append(("contradiction", file_path, None, strategy))
         else:
             print(f"{Colors.YELLOW}⚠️ File not found: {file_path}{Colors.END}")
 
-    print_summary(summary)
-
-
-def load_program_lines(path: Optional[str]) -> List[str]:
-    return read_lines_from_file(path)
-
+    # Rule files rejected by the parser
+    for file_path, word in error_tests:
+        if os.path.exists(file_path):
+            cases.append(("error", file_path, word, strategy))
+        else:
+            print(f"{Colors.YELLOW}⚠️ File not found: {file_path}{Colors.END}")
 
-def load_parse_result(lines: Iterable[str]):
-    pr = parse_input_lines(lines)
-    pr.set_identifiers()
-    return pr
+    # Fact changes on a resident engine
+    for file_path, changes, expected in update_tests:
+        if os.path.exists(file_path):
+            cases.append(("update", file_path, (changes, expected), strategy))
+        else:
+            print(f"{Colors.YELLOW}⚠️ File not found: {file_path}{Colors.END}")
 
+    # Goal-directed runs against full runs
+    for file_path in prune_tests:
+        if os.path.exists(file_path):
+            cases.append(("prune", file_path, None, strategy))
+        else:
+            print(f"{Colors.YELLOW}⚠️ File not found: {file_path}{Colors.END}")
 
-def run_inference(base_lines: List[str], fact_overrides: Dict[str, Optional[bool]], logging):
-    pr = load_parse_result(base_lines)
+    # Symbols outside the cone asked for after a goal-directed run
+    for file_path in value_tests:
+        if os.path.exists(file_path):
+            cases.append(("value", file_path, None, strategy))
+        else:
+            print(f"{Colors.YELLOW}⚠️ File not found: {file_path}{Colors.END}")
 
-    # Apply overrides to known identifiers
-    for ident in pr.symbols:
-        if ident.name in fact_overrides:
-            ident.value = fact_overrides[ident.name]
-    for q in pr.queries:
-        if q.name in fact_overrides:
-            q.value = fact_overrides[q.name]
+    # Specialized rule bases against the original ones
+    for file_path in specialize_tests:
+        if os.path.exists(file_path):
+            cases.append(("specialize", file_path, None, strategy))
+        else:
+            print(f"{Colors.YELLOW}⚠️ File not found: {file_path}{Colors.END}")
 
-    # Add user-created facts that weren't in the original program
-    for name, value in fact_overrides.items():
-        if name not in {i.name for i in pr.symbols}:
-            pr.symbols.add(Ident(name, value))
+    # Profiled runs against plain ones
+    for file_path in profile_tests:
+        if os.path.exists(file_path):
+            cases.append(("profile", file_path, None, strategy))
+        else:
+            print(f"{Colors.YELLOW}⚠️ File not found: {file_path}{Colors.END}")
 
-    engine = Engine(pr, logging)
-    try:
-        engine.backward_chaining()
-    except SystemExit:
-        # engine.backward_chaining calls exit() on errors; keep the window alive instead.
-        raise RuntimeError("Inference halted due to an error. Check your rules.")
+    # Batch evaluation against the engine, when numpy is available
+    if batch.np is None:
+        print(f"{Colors.YELLOW}⚠️ numpy not installed, skipping batch tests{Colors.END}")
+    else:
+        for file_path in batch_tests:
+            if os.path.exists(file_path):
+                cases.append(("batch", file_path, None, strategy))
+            else:
+                print(f"{Colors.YELLOW}⚠️ File not found: {file_path}{Colors.END}")
 
-    queries = {q.name: q.value for q in pr.queries}
-    facts = {ident.name: ident.value for ident in pr.symbols}
-    return queries, facts
+    summary = run_cases(cases, jobs)
+    print_summary(summary)
+    if report:
+        write_report(summary, report)
+
+
+def run_batch(file_path, csv_path):
+    # One output line per scenario row: the query values, or a contradiction
+    codes = {"1": batch.TRUE, "0": batch.FALSE, "": batch.UNKNOWN}
+    with open(csv_path, newline="") as f:
+        columns, *rows = list(csv.reader(f))
+    scenarios = []
+    for line, row in enumerate(rows, start=2):
+        cells = [cell.strip() for cell in row]
+        if len(cells) != len(columns) or any(cell not in codes for cell in cells):
+            raise ValueError(f"Invalid scenario on line {line} of {csv_path}")
+        scenarios.append([codes[cell] for cell in cells])
+
+    result = batch.evaluate_batch(parser(file_path), scenarios, [c.strip() for c in columns])
+    labels = {batch.TRUE: "true", batch.FALSE: "false", batch.UNKNOWN: "none"}
+    print(",".join(["row"] + result.queries))
+    for row, values in enumerate(result.values, start=1):
+        if result.contradictions[row - 1]:
+            print(f"{row},contradiction")
+        else:
+            print(",".join([str(row)] + [labels[int(v)] for v in values]))
 
 
-def launch_interactive_prompt(base_lines: List[str], base_parse_result, logging):
+def launch_interactive_prompt(engine, file_path, logging, strategy="backward"):
     def value_label(v: Optional[bool]) -> str:
         if v is True:
             return "true"
@@ -121,7 +273,7 @@ def launch_interactive_prompt(base_lines: List[str], base_parse_result, logging)
 
     def prompt_fact_name() -> Optional[str]:
         try:
-            name = input(" Fact (A-Z): ").strip().upper()
+            name = input(" Fact name: ").strip().upper()
         except EOFError:
             print()
             return None
@@ -129,8 +281,8 @@ def launch_interactive_prompt(base_lines: List[str], base_parse_result, logging)
         if not name:
             print(" Please enter a fact name.")
             return None
-        if len(name) != 1 or not name.isalpha() or not name.isupper():
-            print(" Use a single uppercase letter (A-Z).")
+        if not all("A" <= ch <= "Z" for ch in name):
+            print(" Use uppercase letters only (A-Z).")
             return None
         return name
 
@@ -157,9 +309,10 @@ def launch_interactive_prompt(base_lines: List[str], base_parse_result, logging)
         if not fact_values:
             print("  (none)")
 
-    fact_values: Dict[str, Optional[bool]] = {
-        ident.name: ident.value for ident in base_parse_result.symbols
-    }
+    fact_values: Dict[str, Optional[bool]] = engine.fact_values(engine.initial)
+
+    # Parsed and built once; MODIFY only changes facts on the resident engine
+    changes: Dict[str, Optional[bool]] = {}
 
     print("Interactive mode. Commands: MODIFY, QUERY, LIST, HELP, EXIT")
     print_fact_values()
@@ -183,19 +336,25 @@ def launch_interactive_prompt(base_lines: List[str], base_parse_result, logging)
                 continue
             value = prompt_fact_value()
             fact_values[name] = value
+            changes[name] = value
             print(f" Set {name} = {value_label(value)}.")
             print_fact_values()
 
         elif raw_cmd == "QUERY":
             try:
-                queries, facts = run_inference(base_lines, fact_values, logging)
-
                 if logging:
                     with open(file_path, "r") as f:
                         print("=== Original file ===\n")
                         print(f.read())
-                    with open("reasoning.log", "r") as f:
-                        print(f.read())
+
+                # Every query answers as a fresh run from the initial facts and
+                # changes would, keeping the values the changes cannot reach
+                engine.update_facts(changes)
+                changes.clear()
+                results = engine.run(strategy)
+
+                queries = {q.name: q.value for q in results}
+                facts = engine.cone_values()
             except Exception as e:
                 print(f" Error during inference: {e}")
                 continue
@@ -207,6 +366,9 @@ def launch_interactive_prompt(base_lines: List[str], base_parse_result, logging)
             print(" Facts after inference:")
             for name in sorted(facts.keys()):
                 print(f"  - {name}: {value_label(facts[name])}")
+            outside = len(engine.symtab) - len(facts)
+            if outside:
+                print(f"  ({outside} symbols outside the queries' cone not evaluated with --prune)")
 
         elif raw_cmd == "LIST":
             print_fact_values()
@@ -235,19 +397,41 @@ if __name__ == "__main__":
 
     try:
         if args.tester:
-            run_tester()
+            run_tester(args.strategy, args.jobs, args.report)
+        elif args.bench:
+            sizes = [int(n) for n in args.bench_sizes.split(",")] if args.bench_sizes else None
+            run_bench(sizes, args.strategy)
         else:
             if not args.input_file:
                 raise ValueError("Interactive mode requires an input file!")
             
             file_path = args.input_file
             logging = args.logs
-            parse_result = parser(file_path)
 
-            if args.interactive:
-                launch_interactive_prompt(load_program_lines(file_path), parse_result, logging)
-            else:
-                run_main(parse_result, file_path, logging)
+            if args.batch:
+                run_batch(file_path, args.batch)
+                sys.exit(0)
+
+            if args.specialize:
+                residual = specialize(parser(file_path))
+                residual.write(args.specialize)
+                print(residual.stats.summary())
+                print(f"Residual rule base written to {args.specialize}")
+                sys.exit(0)
+
+            tracer = make_tracer(args)
+            # Backward chaining never reads the flat arrays, so they are not built for it
+            flat = args.flat and args.strategy != "backward"
+            engine = load_engine(file_path, tracer, args.cache_dir, args.prune, flat)
+
+            try:
+                if args.interactive:
+                    launch_interactive_prompt(engine, file_path, logging, args.strategy)
+                else:
+                    run_main(engine, file_path, logging, args.strategy, args.profile)
+            finally:
+                if tracer:
+                    tracer.close()
 
     except ContradictionException as e:
         print(f"Contradiction detected {e}")
@@ -1,17 +1,20 @@
-from dataclasses import dataclass
-from typing import List, Set, Union, Optional
+from dataclasses import dataclass, field
+from typing import Dict, List, Set, Tuple, Union, Optional
 
 TRUE = True
 FALSE = False
 UNDETERMINED = None
 
-# Expr nodes
-class Expr: pass
+# Expr nodes: slotted, with terms held in tuples. The parser shares one
+# Ident per name between all the rules of a file.
+class Expr:
+	__slots__ = ()
 
-@dataclass
+@dataclass(slots=True)
 class Ident(Expr):
-	name: str	# 'A'-'Z'
-	value: Optional[bool] = None
+	name: str	# one or more of 'A'-'Z'
+	value: Optional[bool] = None	# only set on engine results, never in rules
+	id: int = -1	# dense id from the SymbolTable, -1 until interned
 
 	def __hash__(self) -> int:
 		# Hash only by name so instances with same name dedupe in sets
@@ -20,32 +23,86 @@ class Ident(Expr):
 	def __eq__(self, other: object) -> bool:
 		return isinstance(other, Ident) and self.name == other.name
 
-@dataclass
+@dataclass(slots=True)
 class Not(Expr):
 	child: Expr
 
-@dataclass
+@dataclass(slots=True)
 class And(Expr):
-	terms: List[Expr]
+	terms: Tuple[Expr, ...]
 
-@dataclass
+@dataclass(slots=True)
 class Or(Expr):
-	terms: List[Expr]
+	terms: Tuple[Expr, ...]
 
-@dataclass
+@dataclass(slots=True)
 class Xor(Expr):
-	terms: List[Expr]
+	terms: Tuple[Expr, ...]
 
-@dataclass
+@dataclass(slots=True)
 class Implies:
     premise: Expr
     conclusion: Expr
 
-@dataclass
+@dataclass(slots=True)
 class Equiv:
     left: Expr
     right: Expr
 
+# =========
+# TREE WALKS
+# =========
+# Rules can nest deeper than the recursion limit, so passes over their trees
+# keep their own stack. A pass written as a generator yields the arguments
+# of the call it needs on a child and is sent back its result; walk runs it.
+def walk(step, *args):
+	stack = [step(*args)]
+	result = None
+	while stack:
+		try:
+			request = stack[-1].send(result)
+		except StopIteration as stop:
+			stack.pop()
+			result = stop.value
+		else:
+			stack.append(step(*request))
+			result = None
+	return result
+
+# Identifiers of e from left to right, repeats included
+def idents_of(e: Expr) -> List[Ident]:
+	found = []
+	todo = [e]
+	while todo:
+		e = todo.pop()
+		if isinstance(e, Ident):
+			found.append(e)
+		elif isinstance(e, Not):
+			todo.append(e.child)
+		else:
+			todo.extend(reversed(e.terms))
+	return found
+
+# Symbol table: interns identifier names to dense integer ids
+class SymbolTable:
+	def __init__(self):
+		self.names: List[str] = []
+		self.ids: Dict[str, int] = {}
+
+	def intern(self, name: str) -> int:
+		sid = self.ids.get(name)
+		if sid is None:
+			sid = len(self.names)
+			self.ids[name] = sid
+			self.names.append(name)
+		return sid
+
+	def __len__(self) -> int:
+		return len(self.names)
+
+	def __contains__(self, name: str) -> bool:
+		return name in self.ids
+
 # Parsing result
 @dataclass
 class ParseResult:
@@ -54,42 +111,5 @@ class ParseResult:
 	queries: List[Ident]
 	symbols: Set[Ident]
 	original_rules: List[str]
-
-	# Post-parse: set Ident.value based on initial_facts
-	def set_identifiers(self) -> None:
-		query_names = {q.name for q in self.queries}
-
-		def visit(e: Expr) -> None:
-			if isinstance(e, Ident):
-				# True if present in initial facts.
-				# If it's a queried symbol and not in facts, keep None instead of False.
-				if e.name in self.initial_facts:
-					e.value = True
-				else:
-					e.value = None
-			elif isinstance(e, Not):
-				visit(e.child)
-			elif isinstance(e, (And, Or, Xor)):
-				for t in e.terms:
-					visit(t)
-
-		# Update identifiers within rules
-		for r in self.rules:
-			if isinstance(r, Implies):
-				visit(r.premise)
-				visit(r.conclusion)
-			else:  # Equiv
-				visit(r.left)
-				visit(r.right)
-
-		# For queries and symbols, keep None when not in initial facts
-		for q in self.queries:
-			if q.name in self.initial_facts:
-				q.value = True
-
-		for s in self.symbols:
-			if s.name in self.initial_facts:
-				s.value = True
-			else:
-				s.value = None
-				
+	symtab: SymbolTable = field(default_factory=SymbolTable)
+	normalization: Optional[object] = None	# NormalizeStats of the premises
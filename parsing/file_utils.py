@@ -1,92 +1,135 @@
 from .parser import Parser
+from .normalize import normalize_rules
 from .data import *
-from .lexer import tokenize
-from typing import List, Set, Union, Iterable
+from .lexer import tokenize_bulk, check_tokens
+from typing import Dict, Iterator, List, Optional, Set, Tuple, Union, Iterable
+import hashlib
+import mmap
 import sys
-from pathlib import Path
 
 
 # =========
 # FILE CONTENT PARSING
 # =========
-def parse_input_lines(lines: Iterable[str]) -> ParseResult:
+# Parses blocks of whole lines lexed in bulk, yielding each entry as soon as
+# its line is read:
+# - ("fact", word, line)    for each word of an =ABC line
+# - ("query", word, line)   for each word of a ?XYZ line
+# - ("rule", rule, text)    for each implication or equivalence
+def iter_parse_text(blocks: Iterable[Tuple[int, str]]) -> Iterator[Tuple[str, object, str]]:
+	idents: Dict[str, Ident] = {}
+	for first_line, text in blocks:
+		for _, line, toks in tokenize_bulk(text, first_line):
+			if line.startswith("=") or line.startswith("?"):
+				yield from parse_symbols_line(line, line)
+				continue
+
+			check_tokens(toks, line)
+			yield "rule", parse_rule_tokens(toks, idents), line
+
+
+# Yields each word of a fact or query line; words are resolved to
+# symbols by build_parse_result once every rule has been read
+def parse_symbols_line(line: str, raw: str) -> Iterator[Tuple[str, object, str]]:
+	# Initial facts: =ABCD, queries: ?XYZ
+	if line.startswith("="):
+		kind, label = "fact", "initial fact"
+	else:
+		kind, label = "query", "query"
+
+	for word in line[1:].split():
+		for ch in word:
+			if not ("A" <= ch <= "Z"):
+				raise ValueError(f"Invalid {label} {ch!r} in line: {raw}")
+		yield kind, word, line
+
+
+# Rules parsed with the same idents table share their Ident leaves
+def parse_rule_tokens(toks, idents: Optional[Dict[str, Ident]] = None) -> Union[Implies, Equiv]:
+	p = Parser(toks, idents=idents)
+	if any(t.type == "EQUIV" for t in toks):
+		return p.parse_equiv_line()
+	return p.parse_rule_line()
+
+
+# Short digest of a rule, so duplicate detection does not keep every rule text
+def rule_fingerprint(text: str) -> bytes:
+	return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+def parse_input_text(text: str) -> ParseResult:
+	return build_parse_result(iter_parse_text([(1, text)]))
+
+
+def build_parse_result(entries: Iterable[Tuple[str, object, str]]) -> ParseResult:
 	rules: List[Union[Implies, Equiv]] = []
 	initial_facts: Set[str] = set()
 	queries: List[Ident] = []
-	symbols: Set[Ident] = set()
 	original_rules: List[str] = []
+	fact_words: List[str] = []
+	query_words: List[str] = []
 	duplicate_rules: Set[str] = set()
 	duplicate_queries: Set[str] = set()
 	duplicate_facts: Set[str] = set()
-	seen_rule_text: Set[str] = set()
-	seen_query_names: Set[str] = set()
+	seen_rules: Set[bytes] = set()
+	symtab = SymbolTable()
 
 	def collect(e: Expr):
-		if isinstance(e, Ident):
-			for ch in e.name:
-				if "A" <= ch <= "Z":
-					symbols.add(Ident(ch))
-		elif isinstance(e, (And, Or, Xor)):
-			for t in e.terms:
-				collect(t)
-		elif isinstance(e, Not):
-			collect(e.child)
-
-	for raw in lines:
-		# Strip inline comments and surrounding whitespace
-		cleaned = raw.split("#", 1)[0].strip()
-		line = cleaned
-		if not line:
-			continue
-
-		# Initial facts: =ABCD
-		if line.startswith("="):
-			for ch in line[1:].strip():
-				if ch == " ":
-					continue
-				if not ("A" <= ch <= "Z"):
-					raise ValueError(f"Invalid initial fact {ch!r} in line: {raw.strip()}")
-				if ch in initial_facts:
-					duplicate_facts.add(ch)
-				initial_facts.add(ch)
-				symbols.add(Ident(ch))
-			continue
-
-		# Queries: ?XYZ
-		if line.startswith("?"):
-			for ch in line[1:].strip():
-				if ch == " ":
-					continue
-				if not ("A" <= ch <= "Z"):
-					raise ValueError(f"Invalid query {ch!r} in line: {raw.strip()}")
-				ident = Ident(ch)
-				if ident.name in seen_query_names:
-					duplicate_queries.add(ident.name)
-				else:
-					queries.append(ident)
-					seen_query_names.add(ident.name)
-				symbols.add(ident)
-			continue
-
-		# Rule or equivalence
-		normalized_rule = line.strip()
-		if normalized_rule in seen_rule_text:
-			duplicate_rules.add(normalized_rule)
+		for i in idents_of(e):
+			i.id = symtab.intern(i.name)
+
+	for kind, item, text in entries:
+		if kind == "fact":
+			fact_words.append(item)
+
+		elif kind == "query":
+			query_words.append(item)
+
 		else:
-			seen_rule_text.add(normalized_rule)
-		original_rules.append(cleaned)
-		toks = tokenize(line)
-		p = Parser(toks)
-		if any(t.type == "EQUIV" for t in toks):
-			eq = p.parse_equiv_line()
-			rules.append(eq)
-			collect(eq.left)
-			collect(eq.right)
+			fingerprint = rule_fingerprint(text)
+			if fingerprint in seen_rules:
+				duplicate_rules.add(text)
+			else:
+				seen_rules.add(fingerprint)
+			original_rules.append(text)
+			rules.append(item)
+			if isinstance(item, Equiv):
+				collect(item.left)
+				collect(item.right)
+			else:
+				collect(item.premise)
+				collect(item.conclusion)
+
+	# Words are one symbol per letter, as in =ABC, unless a rule uses a
+	# symbol of several letters: every word is then one whole name, and a
+	# name of several letters that no rule uses is rejected.
+	named = any(len(name) > 1 for name in symtab.names)
+
+	def names_of(word: str, label: str) -> List[str]:
+		if not named:
+			return list(word)
+		if len(word) > 1 and word not in symtab:
+			raise ValueError(f"Invalid {label} {word}: no rule uses it")
+		return [word]
+
+	fact_names = [name for word in fact_words for name in names_of(word, "initial fact")]
+	query_names = [name for word in query_words for name in names_of(word, "query")]
+
+	for name in fact_names:
+		if name in initial_facts:
+			duplicate_facts.add(name)
+		initial_facts.add(name)
+		symtab.intern(name)
+
+	seen_query_names: Set[str] = set()
+	for name in query_names:
+		if name in seen_query_names:
+			duplicate_queries.add(name)
 		else:
-			imp = p.parse_rule_line()
-			rules.append(imp)
-			collect(imp.premise)
-			collect(imp.conclusion)
+			queries.append(Ident(name, id=symtab.intern(name)))
+			seen_query_names.add(name)
+
+	symbols = {Ident(name, id=sid) for sid, name in enumerate(symtab.names)}
 
 	if duplicate_facts:
 		dupes = " ".join(sorted(duplicate_facts))
@@ -102,47 +145,64 @@ def parse_input_lines(lines: Iterable[str]) -> ParseResult:
 	if not queries:
 		raise ValueError("No queries provided in input")
 
-	return ParseResult(rules, initial_facts, queries, symbols, original_rules)
+	normalization = normalize_rules(rules)
+
+	return ParseResult(rules, initial_facts, queries, symbols, original_rules, symtab, normalization)
 
 
 # =========
 # FILE LOADER
 # =========
-# Reads input file and return lines.
+# Streams blocks of whole lines from a memory-mapped file, each block
+# with the number of its first line, for the bulk lexer.
 # Errors handled:
 # - File not found
 # - Permission denied
 # - Empty file (no non-whitespace content)
-def read_lines_from_file(path: str) -> List[str]:
-	p = Path(path)
+def iter_blocks_from_file(path: str, size: int = 1 << 20) -> Iterator[Tuple[int, str]]:
 	try:
-		text = p.read_text(encoding="utf-8")
+		f = open(path, "rb")
 	except FileNotFoundError as e:
 		raise ValueError(f"No such file: {path}") from e
 	except PermissionError as e:
 		raise ValueError(f"Permission denied: {path}") from e
 
-	# Check empty (no non-whitespace content)
-	if not text or not any(ch.strip() for ch in text.splitlines()):
+	has_content = False
+	with f:
+		try:
+			source = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		except ValueError:
+			# Empty files cannot be mapped
+			source = None
+
+		if source is not None:
+			with source:
+				line = 1
+				start = 0
+				while start < len(source):
+					# Cut after the last newline of the block, or take one long line whole
+					end = source.rfind(b"\n", start, start + size) + 1
+					if end <= start:
+						end = source.find(b"\n", start + size) + 1 or len(source)
+					block = source[start:end]
+					has_content = has_content or bool(block.strip())
+					yield line, block.decode("utf-8")
+					line += block.count(b"\n")
+					start = end
+
+	if not has_content:
 		raise ValueError(f"Empty file: {path}")
 
-	return text.splitlines()
 
+def parse_input_file(path: str) -> ParseResult:
+	return build_parse_result(iter_parse_text(iter_blocks_from_file(path)))
 
-def parser(path: str) -> ParseResult:
-	try:
-		lines = read_lines_from_file(path)
-	except ValueError as e:
-		print(f"Error: {e}")
-		sys.exit(1)
 
+def parser(path: str) -> ParseResult:
 	try:
-		pr = parse_input_lines(lines)
+		pr = parse_input_file(path)
 	except ValueError as e:
 		print(f"Error: {e}")
 		sys.exit(1)
 
-	# Set identifiers value based on facts
-	pr.set_identifiers()
-
 	return pr
@@ -1,58 +1,84 @@
 #!/usr/bin/env python3
 
 import re
-from dataclasses import dataclass
-from typing import List, Optional
+from typing import Iterator, List, Optional, Tuple
 
-@dataclass
 class Token:
-	type: str
-	value: Optional[str]
-	index: int
+	# Slotted: no per-token __dict__, rule files produce many of them
+	__slots__ = ("type", "value", "index", "line")
 
-# Token labels correspondance
-# One big regex with named groups
-TOKEN_REGEX = re.compile(
+	def __init__(self, type: str, value: Optional[str], index: int, line: int = 0):
+		self.type = type
+		self.value = value
+		self.index = index
+		self.line = line
+
+	def __repr__(self) -> str:
+		return f"Token(type={self.type!r}, value={self.value!r}, index={self.index}, line={self.line})"
+
+	def __eq__(self, other: object) -> bool:
+		return isinstance(other, Token) and \
+			(self.type, self.value, self.index) == (other.type, other.value, other.index)
+
+
+# =========
+# BULK LEXER
+# =========
+# Tokenizes a whole block of lines in one regex pass. Whitespace is folded
+# into the next match and groups are unnamed, so the token kind is read from
+# m.lastindex, an index into BULK_TYPES.
+BULK_TYPES = [
+	None, "EQUIV", "IMPLIES", "LPAREN", "RPAREN", "NOT", "AND", "OR", "XOR",
+	"IDENT", "NEWLINE", "COMMENT", "ERROR",
+]
+IDENT, NEWLINE, COMMENT = 9, 10, 11
+
+BULK_REGEX = re.compile(
 	r"""
-		(?P<EQUIV><=>)         |  # equivalence
-		(?P<IMPLIES>=\>)       |  # implication
-		(?P<LPAREN>\()         |  # (
-		(?P<RPAREN>\))         |  # )
-		(?P<NOT>!)             |  # !
-		(?P<AND>\+)            |  # +
-		(?P<OR>\|)             |  # |
-		(?P<XOR>[ˆ^])          |  # XOR: accepts U+02C6 (ˆ) or ASCII ^
-		(?P<IDENT>[A-Z]+)      |  # identifiers from A-Z
-		(?P<WS>\s+)               # whitespaces
+		[^\S\n]*         # leading whitespaces
+		(?:
+			(<=>) | (=\>) | (\() | (\)) | (!) | (\+) | (\|) | ([ˆ^]) |
+			([A-Z]+)     |  # identifiers from A-Z
+			(\n)         |  # end of line
+			(\#[^\n]*)   |  # comment until end of line
+			(.)             # anything else, reported if the line is a rule
+		)
 	""",
 	re.VERBOSE,
 )
 
-def tokenize(text: str) -> List[Token]:
+# Yields (line number, text without comment, tokens) for each non-empty line.
+# Token indexes are columns within their line, starting at 0.
+def tokenize_bulk(text: str, first_line: int = 1) -> Iterator[Tuple[int, str, List[Token]]]:
+	line = first_line
+	line_start = 0
 	tokens: List[Token] = []
+	append = tokens.append
+
+	for m in BULK_REGEX.finditer(text):
+		kind = m.lastindex
+		if kind == NEWLINE:
+			if tokens:
+				yield line, text[line_start:m.start(kind)].split("#", 1)[0].strip(), tokens
+				tokens = []
+				append = tokens.append
+			line += 1
+			line_start = m.end()
+		elif kind != COMMENT:
+			value = m.group(kind) if kind >= IDENT else None
+			append(Token(BULK_TYPES[kind], value, m.start(kind) - line_start, line))
+
+	if tokens:
+		yield line, text[line_start:].split("#", 1)[0].strip(), tokens
+
 
-	i = 0
-	while i < len(text):
-		# Check for regex match
-		m = TOKEN_REGEX.match(text, i)
-
-		# Syntax error, no matches found
-		if not m:
-			# Unknown character, syntax error with context
-			wrong_char = text[i]
-			neighbor_text = text[max(0, i-10):i+10]
-			raise ValueError(f"Unknown character {wrong_char!r} at index {i}. Context: {neighbor_text!r}")
-		
-		# Get value and type of token
-		token_type = m.lastgroup
-		value = m.group(token_type)
-
-		# Skips white spaces
-		if token_type == "WS":
-			i = m.end()
-			continue
-		
-		# Add token to the list
-		tokens.append(Token(token_type, value if token_type in {"IDENT"} else None, m.start()))
-		i = m.end()
-	return tokens
+def check_tokens(tokens: List[Token], text: str) -> None:
+	# Unknown character, syntax error with line/column and context
+	for t in tokens:
+		if t.type == "ERROR":
+			i = t.index - tokens[0].index
+			neighbor_text = text[max(0, i - 10):i + 10]
+			raise ValueError(
+				f"Unknown character {t.value!r} at line {t.line}, column {t.index + 1}. "
+				f"Context: {neighbor_text!r}"
+			)
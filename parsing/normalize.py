@@ -0,0 +1,140 @@
+from dataclasses import dataclass
+from typing import Dict, List, Tuple, Union
+from .data import *
+
+# =========
+# PREMISE NORMALIZATION
+# =========
+# Rewrites rule premises into smaller, flatter trees with the same value:
+# - And / Or / Xor nested in the same operator are flattened
+# - double negations are removed, and a negation is pushed into an And / Or
+#   (De Morgan) when that leaves fewer negations
+# - repeated And / Or terms are dropped, Xor terms repeated an even number
+#   of times cancel out
+# - an And / Or left with a single term is replaced by that term
+# A premise Xor ignores its undetermined terms instead of being undetermined,
+# so no negation is pushed into it and it is never unwrapped.
+# Conclusions and both sides of equivalences are kept as written: the engine
+# concludes from their exact shape.
+
+@dataclass
+class NormalizeStats:
+	rules: int = 0			# rules whose premise was rewritten
+	nodes_before: int = 0	# expression nodes in the whole rule base
+	nodes_after: int = 0
+
+	def summary(self) -> str:
+		saved = self.nodes_before - self.nodes_after
+		percent = 100 * saved / self.nodes_before if self.nodes_before else 0
+		return (f"Normalized {self.rules} rule premises: {self.nodes_before} -> "
+				f"{self.nodes_after} expression nodes ({percent:.1f}% smaller)")
+
+DUAL = {And: Or, Or: And}
+
+# Key of a normalized operator node. Keys are interned in a table per
+# normalize call, one instance per structure, so they are hashed and compared
+# by identity without walking the structure below them.
+class OperatorKey:
+	__slots__ = ("terms",)
+
+	def __init__(self, terms: Tuple[object, ...]):
+		self.terms = terms
+
+# Returns the normalized expression and a hashable key of its structure;
+# e itself is returned when nothing changed
+def normalize(e: Expr, negate: bool = False) -> Tuple[Expr, object]:
+	return walk(normalize_step, e, negate, {})
+
+# One node of normalize, run by walk: each yield normalizes a child
+def normalize_step(e: Expr, negate: bool, keys: Dict[tuple, OperatorKey]):
+	if isinstance(e, Ident):
+		if negate:
+			return Not(e), ("!", e.name)
+		return e, e.name
+
+	if isinstance(e, Not):
+		result = yield e.child, not negate, keys
+		# Only the negation itself came back: keep the node as written
+		if not negate and isinstance(result[0], Not) and result[0].child is e.child:
+			return e, result[1]
+		return result
+
+	op = type(e)
+	if negate:
+		# De Morgan only when most terms are negations already
+		negated = sum(isinstance(t, Not) for t in e.terms)
+		if op is Xor or negated < len(e.terms) - negated:
+			inner, key = yield e, False, keys
+			return Not(inner), ("!", key)
+		op = DUAL[op]
+
+	# Flatten, keeping the key of every term
+	terms: List[Tuple[Expr, object]] = []
+	changed = negate
+	for t in e.terms:
+		term, key = yield t, negate, keys
+		changed = changed or term is not t
+		if type(term) is op:
+			terms.extend(zip(term.terms, key.terms))
+			changed = True
+		else:
+			terms.append((term, key))
+
+	if op is Xor:
+		counts = {}
+		for _, key in terms:
+			counts[key] = counts.get(key, 0) + 1
+		kept = [(t, key) for t, key in terms if counts.pop(key, 0) % 2]
+		# Everything cancelled: keep one pair, the Xor is always False
+		if not kept:
+			kept = [terms[0], terms[0]]
+	else:
+		seen = set()
+		kept = []
+		for t, key in terms:
+			if key not in seen:
+				seen.add(key)
+				kept.append((t, key))
+		if len(kept) == 1:
+			return kept[0]
+
+	changed = changed or len(kept) != len(e.terms)
+	structure = (op.__name__, tuple(key for _, key in kept))
+	key = keys.get(structure)
+	if key is None:
+		key = keys[structure] = OperatorKey(structure[1])
+	if not changed:
+		return e, key
+	return op(tuple(t for t, _ in kept)), key
+
+def count_nodes(e: Expr) -> int:
+	count = 0
+	todo = [e]
+	while todo:
+		e = todo.pop()
+		count += 1
+		if isinstance(e, Not):
+			todo.append(e.child)
+		elif not isinstance(e, Ident):
+			todo.extend(e.terms)
+	return count
+
+def rule_nodes(r: Union[Implies, Equiv]) -> int:
+	if isinstance(r, Implies):
+		return count_nodes(r.premise) + count_nodes(r.conclusion)
+	return count_nodes(r.left) + count_nodes(r.right)
+
+# Normalizes the premise of every implication in place
+def normalize_rules(rules: List[Union[Implies, Equiv]]) -> NormalizeStats:
+	stats = NormalizeStats()
+	for r in rules:
+		before = rule_nodes(r)
+		stats.nodes_before += before
+		if isinstance(r, Implies):
+			premise, _ = normalize(r.premise)
+			if premise is not r.premise:
+				r.premise = premise
+				stats.rules += 1
+				before = rule_nodes(r)
+		stats.nodes_after += before
+	return stats
@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
 
-from typing import List, Optional, Union
+from typing import Dict, List, Optional, Union
 from .data import	Expr,	\
 					And, \
 					Or, \
@@ -9,29 +9,42 @@ from .data import	Expr,	\
 					Not, \
 					And, \
 					Implies, \
-					Equiv
+					Equiv, \
+					walk
 from .lexer import Token
 
 # =========
 # PARSER CLASS
 # =========
 class Parser:
-	def __init__(self, tokens: List[Token]):
+	def __init__(self, tokens: List[Token], idents: Optional[Dict[str, Ident]] = None):
 		self.tokens = tokens
 		self.i = 0
+		# One leaf per name, shared with every parser given the same table
+		self.idents = {} if idents is None else idents
 
-	def at(self, *kinds: str) -> bool:
-		return self.i < len(self.tokens) and self.tokens[self.i].type in kinds
+	def ident(self, name: str) -> Ident:
+		node = self.idents.get(name)
+		if node is None:
+			node = self.idents[name] = Ident(name)
+		return node
 
 	def cur(self) -> Optional[Token]:
 		return self.tokens[self.i] if self.i < len(self.tokens) else None
 
+	def where(self, t: Optional[Token]) -> str:
+		# Line and column of t, or the end of the line once tokens run out
+		if t is not None:
+			return f"line {t.line}, column {t.index + 1}"
+		if self.tokens:
+			return f"end of line {self.tokens[-1].line}"
+		return "end of line"
+
 	def eat(self, kind: str) -> Token:
 		t = self.cur()
 		if not t or t.type != kind:
-			where = t.index if t else -1
 			got = t.type if t else "EOF"
-			raise ValueError(f"Expected {kind}, got {got} at {where}")
+			raise ValueError(f"Expected {kind}, got {got} at {self.where(t)}")
 		self.i += 1
 		return t
 
@@ -42,53 +55,69 @@ class Parser:
 	# and_expr := unary ( 'AND' unary )*
 	# unary := 'NOT' unary | primary
 	# primary := IDENT | '(' expr ')'
+	# Parsed without recursion: each open parenthesis pushes a frame
+	# [nots, or_terms, xor_terms, and_terms], where nots counts the '!'
+	# waiting for the parenthesized operand.
 
 	def parse_expr(self) -> Expr:
-		return self.parse_or()
-
-	def parse_or(self) -> Expr:
-		left = self.parse_xor()
-		terms = [left]
-		while self.at("OR"):
-			self.eat("OR")
-			terms.append(self.parse_xor())
-		return terms[0] if len(terms) == 1 else Or(terms)
-
-	def parse_xor(self) -> Expr:
-		left = self.parse_and()
-		terms = [left]
-		while self.at("XOR"):
-			self.eat("XOR")
-			terms.append(self.parse_and())
-		return terms[0] if len(terms) == 1 else Xor(terms)
-
-	def parse_and(self) -> Expr:
-		left = self.parse_unary()
-		terms = [left]
-		while self.at("AND"):
-			self.eat("AND")
-			terms.append(self.parse_unary())
-		return terms[0] if len(terms) == 1 else And(terms)
-
-	def parse_unary(self) -> Expr:
-		if self.at("NOT"):
-			self.eat("NOT")
-			return Not(self.parse_unary())
-		return self.parse_primary()
-
-	def parse_primary(self) -> Expr:
-		if self.at("IDENT"):
-			name = self.eat("IDENT").value
-			return Ident(name)
-		if self.at("LPAREN"):
-			self.eat("LPAREN")
-			node = self.parse_expr()
-			self.eat("RPAREN")
-			return node
-		t = self.cur()
-		where = t.index if t else -1
-		got = t.type if t else "EOF"
-		raise ValueError(f"Expected IDENT or '(', got {got} at {where}")
+		tokens = self.tokens
+		n = len(tokens)
+		i = self.i
+		stack = []
+		frame = [0, [], [], []]
+
+		while True:
+			# Operand: any number of NOT, then IDENT or '('
+			nots = 0
+			while i < n and tokens[i].type == "NOT":
+				nots += 1
+				i += 1
+			t = tokens[i] if i < n else None
+			if t is not None and t.type == "LPAREN":
+				i += 1
+				stack.append(frame)
+				frame = [nots, [], [], []]
+				continue
+			if t is None or t.type != "IDENT":
+				self.i = i
+				got = t.type if t else "EOF"
+				raise ValueError(f"Expected IDENT or '(', got {got} at {self.where(t)}")
+			i += 1
+			node = self.ident(t.value)
+
+			while True:
+				for _ in range(nots):
+					node = Not(node)
+				frame[3].append(node)
+
+				kind = tokens[i].type if i < n else None
+				if kind == "AND":
+					i += 1
+					break
+				if kind == "XOR":
+					i += 1
+					frame[2].append(close_terms(frame[3], And))
+					frame[3] = []
+					break
+				if kind == "OR":
+					i += 1
+					frame[2].append(close_terms(frame[3], And))
+					frame[1].append(close_terms(frame[2], Xor))
+					frame[2], frame[3] = [], []
+					break
+
+				# End of the current expression
+				frame[2].append(close_terms(frame[3], And))
+				frame[1].append(close_terms(frame[2], Xor))
+				node = close_terms(frame[1], Or)
+				if not stack:
+					self.i = i
+					return node
+				self.i = i
+				self.eat("RPAREN")
+				i = self.i
+				nots = frame[0]
+				frame = stack.pop()
 
 	# ----- Rule line parsers -----
 	# rule_line := expr 'IMPLIES' conclusion
@@ -113,22 +142,34 @@ class Parser:
 		return self.parse_expr()
 # ---- End of Parser class ----
 
+def close_terms(terms: List[Expr], op) -> Expr:
+	return terms[0] if len(terms) == 1 else op(tuple(terms))
+
 # =========
 # DEBUG PRINT
 # =========
+PRECEDENCE = {Or: 1, Xor: 2, And: 3, Not: 4, Ident: 5}
+OPERATORS = {And: " + ", Or: " | ", Xor: " ^ "}
+
+# Prints e so that it parses back to the same tree
 def pretty_expr(e: Expr) -> str:
+	return walk(pretty_step, e)
+
+# One node of pretty_expr, run by walk: each yield prints a child
+def pretty_step(e: Expr):
 	if isinstance(e, Ident):
-		# Include the current boolean value of the identifier
-		return f"{e.name}={e.value}"
+		return e.name
 	if isinstance(e, Not):
-		return f"!{pretty_expr(e.child)}"
-	if isinstance(e, And):
-		return " + ".join(pretty_expr(t) for t in e.terms)
-	if isinstance(e, Or):
-		return " | ".join(pretty_expr(t) for t in e.terms)
-	if isinstance(e, Xor):
-		return " ^ ".join(pretty_expr(t) for t in e.terms)
-	return "<??>"
+		child = yield (e.child,)
+		return f"!{child}" if isinstance(e.child, (Ident, Not)) else f"!({child})"
+
+	parts = []
+	for t in e.terms:
+		text = yield (t,)
+		if PRECEDENCE[type(t)] <= PRECEDENCE[type(e)]:
+			text = f"({text})"
+		parts.append(text)
+	return OPERATORS[type(e)].join(parts)
 
 def pretty_rule(r: Union[Implies, Equiv]) -> str:
 	if isinstance(r, Implies):
@@ -1,6 +1,15 @@
 from execution.exec import Engine, ContradictionException
-from parsing.file_utils import parser
+from execution.batch import BatchEvaluator, TRUE, FALSE, UNKNOWN
+from execution.profile import Profiler
+from execution.specialize import specialize
+from parsing.data import Ident
+from parsing.file_utils import parse_input_file
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+import json
 import os
+import tracemalloc
+import xml.etree.ElementTree as ET
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
@@ -61,6 +70,10 @@ tests = {
         "P": False,
         "R": False,
     },
+    os.path.join(BASE_DIR, "inputs/complex_tests/and_conclusions/4.txt"): {
+        "D": True,
+        "E": False,
+    },
     # Negation
     os.path.join(BASE_DIR, "inputs/complex_tests/negation/1.txt"): {
         "B": True,
@@ -185,6 +198,63 @@ tests = {
         "D": None,
         "E": None
     },
+    # Cycles
+    os.path.join(BASE_DIR, "inputs/complex_tests/cycles/1.txt"): {
+        "A": True,
+        "B": True
+    },
+    # Deep nesting
+    os.path.join(BASE_DIR, "inputs/complex_tests/deep_nesting/1.txt"): {
+        "B": True,
+        "C": True
+    },
+    os.path.join(BASE_DIR, "inputs/complex_tests/deep_nesting/2.txt"): {
+        "B": True,
+        "D": False
+    },
+    os.path.join(BASE_DIR, "inputs/complex_tests/deep_nesting/3.txt"): {
+        "C": False,
+        "D": True
+    },
+    # Pruning
+    os.path.join(BASE_DIR, "inputs/complex_tests/pruning/1.txt"): {
+        "E": True
+    },
+    os.path.join(BASE_DIR, "inputs/complex_tests/pruning/2.txt"): {
+        "D": True
+    },
+    # Multi-letter symbols
+    os.path.join(BASE_DIR, "inputs/complex_tests/multi_letter/1.txt"): {
+        "SNOW": True,
+        "SALT": True,
+        "DRY": False,
+        "ICEFREE": False,
+        "C": False
+    },
+    os.path.join(BASE_DIR, "inputs/complex_tests/multi_letter/2.txt"): {
+        "AB": True,
+        "A": False,
+        "B": False,
+        "C": True,
+        "D": False,
+        "OUT": True
+    },
+}
+
+# Results that depend on the strategy. In specialize/2.txt G is True
+# whatever C is, its premise being a Xor of three True terms, so C only
+# occurs under !(C | A | E) with A True: backward chaining leaves it
+# undetermined, forward and scc chaining default it to False
+strategy_tests = {
+    "backward": {
+        os.path.join(BASE_DIR, "inputs/complex_tests/specialize/2.txt"): {"C": None},
+    },
+    "forward": {
+        os.path.join(BASE_DIR, "inputs/complex_tests/specialize/2.txt"): {"C": False},
+    },
+    "scc": {
+        os.path.join(BASE_DIR, "inputs/complex_tests/specialize/2.txt"): {"C": False},
+    },
 }
 
 contradiction_tests = [
@@ -194,6 +264,118 @@ contradiction_tests = [
     os.path.join(BASE_DIR, "inputs/complex_tests/contradictions/4.txt")
 ]
 
+# Rule files rejected when parsed, and a word the error names
+error_tests = [
+    (os.path.join(BASE_DIR, "inputs/complex_tests/multi_letter/3.txt"), "FOOBAR"),
+]
+
+# Initial facts changed on a resident engine after a first run,
+# and the results expected from the next run
+update_tests = [
+    (os.path.join(BASE_DIR, "inputs/complex_tests/updates/1.txt"), {"D": True}, {
+        "D": True,
+        "F": False
+    }),
+    # Values upstream of the change are kept from the first run
+    (os.path.join(BASE_DIR, "inputs/complex_tests/and_conclusions/1.txt"), {"F": None}, {
+        "A": False,
+        "B": None,
+        "C": None
+    }),
+    (os.path.join(BASE_DIR, "inputs/complex_tests/and_conclusions/2.txt"), {"M": True}, {
+        "I": True,
+        "J": True,
+        "K": True,
+        "M": True
+    }),
+]
+
+# Acyclic rule bases evaluated in batch, from the initial facts and with each
+# other symbol set True in turn, against one engine run per scenario
+batch_tests = [
+    os.path.join(BASE_DIR, "inputs/complex_tests/and_conclusions/1.txt"),
+    os.path.join(BASE_DIR, "inputs/complex_tests/and_conclusions/2.txt"),
+    os.path.join(BASE_DIR, "inputs/complex_tests/and_conclusions/3.txt"),
+    os.path.join(BASE_DIR, "inputs/complex_tests/and_conclusions/4.txt"),
+    os.path.join(BASE_DIR, "inputs/complex_tests/negation/1.txt"),
+    os.path.join(BASE_DIR, "inputs/complex_tests/negation/2.txt"),
+    os.path.join(BASE_DIR, "inputs/complex_tests/negation/3.txt"),
+    os.path.join(BASE_DIR, "inputs/complex_tests/or_conditions/1.txt"),
+    os.path.join(BASE_DIR, "inputs/complex_tests/or_conditions/2.txt"),
+    os.path.join(BASE_DIR, "inputs/complex_tests/or_conditions/3.txt"),
+    os.path.join(BASE_DIR, "inputs/complex_tests/or_conditions/4.txt"),
+    os.path.join(BASE_DIR, "inputs/complex_tests/parentheses/1.txt"),
+    os.path.join(BASE_DIR, "inputs/complex_tests/parentheses/2.txt"),
+    os.path.join(BASE_DIR, "inputs/complex_tests/parentheses/3.txt"),
+    os.path.join(BASE_DIR, "inputs/complex_tests/same_conclusion/2.txt"),
+    os.path.join(BASE_DIR, "inputs/complex_tests/xor_conditions/1.txt"),
+    os.path.join(BASE_DIR, "inputs/complex_tests/xor_conditions/2.txt"),
+    os.path.join(BASE_DIR, "inputs/complex_tests/xor_conditions/3.txt"),
+    os.path.join(BASE_DIR, "inputs/complex_tests/or_conclusions/1.txt"),
+    os.path.join(BASE_DIR, "inputs/complex_tests/or_conclusions/2.txt"),
+    os.path.join(BASE_DIR, "inputs/complex_tests/or_conclusions/3.txt"),
+    os.path.join(BASE_DIR, "inputs/complex_tests/xor_conclusions/2.txt"),
+    os.path.join(BASE_DIR, "inputs/complex_tests/xor_conclusions/4.txt"),
+    os.path.join(BASE_DIR, "inputs/complex_tests/deep_nesting/1.txt"),
+    os.path.join(BASE_DIR, "inputs/complex_tests/deep_nesting/3.txt"),
+    # Equivalences, settled as one group of symbols
+    os.path.join(BASE_DIR, "inputs/example.txt"),
+    os.path.join(BASE_DIR, "inputs/unit_tests/and_rules.txt"),
+    os.path.join(BASE_DIR, "inputs/unit_tests/not_rules.txt"),
+    os.path.join(BASE_DIR, "inputs/unit_tests/or_rules.txt"),
+    os.path.join(BASE_DIR, "inputs/unit_tests/xor_rules.txt"),
+    os.path.join(BASE_DIR, "inputs/complex_tests/deep_nesting/2.txt"),
+    os.path.join(BASE_DIR, "inputs/complex_tests/or_conclusions/4.txt"),
+    os.path.join(BASE_DIR, "inputs/complex_tests/parentheses/4.txt"),
+    os.path.join(BASE_DIR, "inputs/complex_tests/parentheses/5.txt"),
+    os.path.join(BASE_DIR, "inputs/complex_tests/parentheses/6.txt"),
+    os.path.join(BASE_DIR, "inputs/complex_tests/same_conclusion/1.txt"),
+    os.path.join(BASE_DIR, "inputs/complex_tests/same_conclusion/3.txt"),
+    os.path.join(BASE_DIR, "inputs/complex_tests/xor_conclusions/1.txt"),
+    os.path.join(BASE_DIR, "inputs/complex_tests/xor_conclusions/3.txt"),
+    os.path.join(BASE_DIR, "inputs/complex_tests/xor_conditions/4.txt"),
+]
+
+# Rule bases run in goal-directed mode, reporting the same query values as a
+# full run, and the same values for every symbol of the queries' cone
+prune_tests = [
+    os.path.join(BASE_DIR, "inputs/complex_tests/pruning/1.txt"),
+    os.path.join(BASE_DIR, "inputs/complex_tests/pruning/2.txt"),
+    os.path.join(BASE_DIR, "inputs/complex_tests/same_conclusion/1.txt"),
+    os.path.join(BASE_DIR, "inputs/complex_tests/parentheses/3.txt"),
+]
+
+# Rule bases run in goal-directed mode, then asked for each symbol outside the
+# queries' cone, first to last and last to first: each value is the one a run
+# querying that symbol gives
+value_tests = [
+    os.path.join(BASE_DIR, "inputs/complex_tests/pruning/1.txt"),
+    os.path.join(BASE_DIR, "inputs/complex_tests/pruning/2.txt"),
+]
+
+# Rule bases run with a profiler, giving the same results as without it and
+# reporting a proof of every symbol that rules conclude and facts do not set
+profile_tests = [
+    os.path.join(BASE_DIR, "inputs/example.txt"),
+    os.path.join(BASE_DIR, "inputs/complex_tests/deep_nesting/1.txt"),
+    os.path.join(BASE_DIR, "inputs/complex_tests/cycles/1.txt"),
+]
+
+# Rule bases specialized against their own initial facts, the residual rule
+# base giving the same answers as the original one
+specialize_tests = [
+    os.path.join(BASE_DIR, "inputs/complex_tests/specialize/1.txt"),
+    os.path.join(BASE_DIR, "inputs/complex_tests/specialize/2.txt"),
+    os.path.join(BASE_DIR, "inputs/complex_tests/specialize/3.txt"),
+    os.path.join(BASE_DIR, "inputs/complex_tests/contradictions/4.txt"),
+    os.path.join(BASE_DIR, "inputs/complex_tests/deep_nesting/3.txt"),
+    os.path.join(BASE_DIR, "inputs/complex_tests/or_conditions/4.txt"),
+    os.path.join(BASE_DIR, "inputs/complex_tests/pruning/1.txt"),
+    os.path.join(BASE_DIR, "inputs/complex_tests/xor_conditions/4.txt"),
+    os.path.join(BASE_DIR, "inputs/unit_tests/not_rules.txt"),
+    os.path.join(BASE_DIR, "inputs/unit_tests/xor_rules.txt"),
+]
+
 
 class Colors:
     GREEN = "\033[94m"
@@ -204,10 +386,10 @@ class Colors:
     BOLD = "\033[1m"
 
 
-def run_test(file_path, expected):
-    pr = parser(file_path)
+def run_test(file_path, expected, strategy="backward"):
+    pr = parse_input_file(file_path)
     engine = Engine(pr)
-    results = engine.backward_chaining()
+    results = engine.run(strategy)
     
     output = {q.name: q.value for q in results}
     passed = all(output.get(k) == v for k, v in expected.items())
@@ -220,11 +402,150 @@ def run_test(file_path, expected):
     }
 
 
-def run_contradiction_test(file_path):
+def run_update_test(file_path, changes, expected, strategy="backward"):
+    engine = Engine(parse_input_file(file_path))
+    engine.run(strategy)
+    engine.update_facts(changes)
+    results = engine.run(strategy)
+
+    output = {q.name: q.value for q in results}
+    passed = all(output.get(k) == v for k, v in expected.items())
+
+    return {
+        "file": file_path,
+        "passed": passed,
+        "results": output,
+        "expected": expected
+    }
+
+
+def run_batch_test(file_path, strategy="backward"):
+    pr = parse_input_file(file_path)
+    batch = BatchEvaluator(pr)
+    initial = set(pr.initial_facts)
+    scenarios = [initial] + [initial | {name} for name in batch.names if name not in initial]
+    result = batch.evaluate([
+        [TRUE if name in facts else UNKNOWN for name in batch.names] for facts in scenarios
+    ])
+
+    codes = {True: TRUE, False: FALSE, None: UNKNOWN}
+    for row, facts in enumerate(scenarios):
+        engine = Engine(parse_input_file(file_path))
+        engine.update_facts({name: True if name in facts else None for name in batch.names})
+        try:
+            expected = [codes[q.value] for q in engine.run(strategy)]
+            contradiction = False
+        except ContradictionException:
+            expected, contradiction = None, True
+
+        got = [int(v) for v in result.values[row]]
+        if contradiction != bool(result.contradictions[row]) or (not contradiction and got != expected):
+            scenario = "=" + "".join(sorted(facts))
+            return {"file": file_path, "passed": False,
+                    "error": f"Batch and engine differ for {scenario}: {got} != {expected}"}
+    return {"file": file_path, "passed": True}
+
+
+def run_prune_test(file_path, strategy="backward"):
+    full = Engine(parse_input_file(file_path))
+    queries = {q.name: q.value for q in full.run(strategy)}
+    values = full.fact_values()
+
+    pruned = Engine(parse_input_file(file_path), prune=True)
+    output = {q.name: q.value for q in pruned.run(strategy)}
+    differ = sorted(
+        name for name, value in pruned.cone_values().items() if values[name] != value
+    )
+
+    if output != queries or differ:
+        return {"file": file_path, "passed": False, "results": output, "expected": queries,
+                "error": f"Pruned and full runs differ on: {' '.join(differ) or 'queries'}"}
+    return {"file": file_path, "passed": True, "results": output}
+
+
+def run_value_test(file_path, strategy="backward"):
+    def queried(name):
+        pr = parse_input_file(file_path)
+        pr.queries = pr.queries + [Ident(name, id=pr.symtab.ids[name])]
+        return {q.name: q.value for q in Engine(pr).run(strategy)}[name]
+
+    engine = Engine(parse_input_file(file_path), prune=True)
+    engine.run(strategy)
+    outside = [name for name in engine.symtab.names if engine.symtab.ids[name] not in engine.cone]
+    expected = {name: queried(name) for name in outside}
+
+    for order in (outside, outside[::-1]):
+        engine = Engine(parse_input_file(file_path), prune=True)
+        engine.run(strategy)
+        output = {name: engine.value(name) for name in order}
+        if output != expected:
+            return {"file": file_path, "passed": False, "results": output, "expected": expected,
+                    "error": f"Values asked in the order {' '.join(order)} differ"}
+    return {"file": file_path, "passed": True, "results": expected}
+
+
+def run_profile_test(file_path, strategy="backward"):
+    expected = {q.name: q.value for q in Engine(parse_input_file(file_path)).run(strategy)}
+
+    pr = parse_input_file(file_path)
+    engine = Engine(pr)
+    engine.set_profiler(Profiler())
+    output = {q.name: q.value for q in engine.run(strategy)}
+    report = engine.profiler.report(engine)
+
+    proven = {s["symbol"] for s in report["symbols"] if s["proofs"]}
+    concluded = {
+        name for name in engine.symtab.names
+        if engine.symbol_nodes[engine.symtab.ids[name]].produced_by_rules
+    }
+    missing = sorted(concluded - set(pr.initial_facts) - proven)
+
+    if output != expected:
+        return {"file": file_path, "passed": False, "results": output, "expected": expected,
+                "error": "Profiled and plain runs differ"}
+    if missing or report["max_depth"] == 0:
+        return {"file": file_path, "passed": False, "results": output,
+                "error": f"Profile reports no proof of: {' '.join(missing) or 'any symbol'}"}
+    return {"file": file_path, "passed": True, "results": output}
+
+
+def run_specialize_test(file_path, strategy="backward"):
+    # Query values, None when the rule base is contradictory
+    def answers(pr):
+        try:
+            return {q.name: q.value for q in Engine(pr).run(strategy)}
+        except ContradictionException:
+            return None
+
+    expected = answers(parse_input_file(file_path))
+    output = answers(specialize(parse_input_file(file_path)).parse())
+    if output is None or expected is None:
+        if output is expected:
+            return {"file": file_path, "passed": True}
+        which = "specialized" if output is None else "original"
+        return {"file": file_path, "passed": False,
+                "error": f"Only the {which} rule base is contradictory"}
+    if output != expected:
+        return {"file": file_path, "passed": False, "results": output, "expected": expected,
+                "error": "Specialized and original rule bases differ"}
+    return {"file": file_path, "passed": True, "results": output}
+
+
+def run_error_test(file_path, word):
+    try:
+        parse_input_file(file_path)
+        return {"file": file_path, "passed": False, "error": "No ValueError was raised"}
+    except ValueError as e:
+        if word not in str(e):
+            return {"file": file_path, "passed": False, "error": f"Error does not name {word}: {e}"}
+        return {"file": file_path, "passed": True}
+
+
+def run_contradiction_test(file_path, strategy="backward"):
     try:
-        pr = parser(file_path)
+        pr = parse_input_file(file_path)
         engine = Engine(pr)
-        engine.backward_chaining()
+        engine.run(strategy)
         return {"file": file_path, "passed": False, "error": "No ContradictionException was raised"}
     except ContradictionException:
         return {"file": file_path, "passed": True}
@@ -232,6 +553,75 @@ def run_contradiction_test(file_path):
         return {"file": file_path, "passed": False, "error": f"Unexpected exception: {type(e).__name__}"}
 
 
+# =========
+# PARALLEL RUNS
+# =========
+# Each case runs in a worker process; any error, including SystemExit,
+# fails that case only. Peak memory is the Python heap peak of the case.
+
+def run_case(case):
+    kind, file_path, expected, strategy = case
+    tracemalloc.start()
+    start = perf_counter()
+    try:
+        if kind == "contradiction":
+            result = run_contradiction_test(file_path, strategy)
+        elif kind == "error":
+            result = run_error_test(file_path, expected)
+        elif kind == "batch":
+            result = run_batch_test(file_path, strategy)
+        elif kind == "prune":
+            result = run_prune_test(file_path, strategy)
+        elif kind == "value":
+            result = run_value_test(file_path, strategy)
+        elif kind == "specialize":
+            result = run_specialize_test(file_path, strategy)
+        elif kind == "profile":
+            result = run_profile_test(file_path, strategy)
+        elif kind == "update":
+            result = run_update_test(file_path, *expected, strategy)
+        else:
+            result = run_test(file_path, expected, strategy)
+    except (Exception, SystemExit) as e:
+        result = {"file": file_path, "passed": False, "error": f"{type(e).__name__}: {e}"}
+    result["time"] = perf_counter() - start
+    result["peak_memory"] = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result
+
+
+def run_cases(cases, jobs=None):
+    # Results come back in the order of cases
+    if jobs == 1 or len(cases) <= 1:
+        return [run_case(case) for case in cases]
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        return list(pool.map(run_case, cases, chunksize=max(1, len(cases) // 64)))
+
+
+def write_report(summary, path):
+    # JUnit XML for .xml paths, JSON otherwise
+    if path.endswith(".xml"):
+        suite = ET.Element("testsuite", {
+            "name": "expert-system",
+            "tests": str(len(summary)),
+            "failures": str(sum(1 for r in summary if not r["passed"])),
+            "time": f"{sum(r.get('time', 0) for r in summary):.6f}",
+        })
+        for r in summary:
+            case = ET.SubElement(suite, "testcase", {
+                "classname": os.path.basename(os.path.dirname(r["file"])),
+                "name": r["file"],
+                "time": f"{r.get('time', 0):.6f}",
+            })
+            if not r["passed"]:
+                failure = ET.SubElement(case, "failure", {"message": r.get("error", "Mismatched results")})
+                failure.text = json.dumps({k: r[k] for k in ("results", "expected") if k in r})
+        ET.ElementTree(suite).write(path, encoding="utf-8", xml_declaration=True)
+    else:
+        with open(path, "w") as f:
+            json.dump(summary, f, indent=2)
+
+
 def print_summary(summary):
     total = len(summary)
     passed_count = sum(1 for r in summary if r['passed'])
@@ -244,7 +634,10 @@ def print_summary(summary):
 
     for r in summary:
         status = f"{Colors.GREEN}PASSED ✅{Colors.END}" if r['passed'] else f"{Colors.RED}FAILED ❌{Colors.END}"
-        print(f"{Colors.BOLD}Test:{Colors.END} {r['file']} | Status: {status}")
+        timing = ""
+        if 'time' in r:
+            timing = f" | {r['time'] * 1000:.1f} ms, {r['peak_memory'] / 1024:.0f} KiB"
+        print(f"{Colors.BOLD}Test:{Colors.END} {r['file']} | Status: {status}{timing}")
 
         if not r['passed']:
             if 'results' in r and 'expected' in r: